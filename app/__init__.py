@@ -8,8 +8,19 @@ from flask_marshmallow import Marshmallow
 from flask_migrate import Migrate
 from flask_mqtt import Mqtt
 from influxdb_client import InfluxDBClient
+from sqlalchemy import event
 
 from config import config
+from app.blocklist import TokenBlocklist
+from app.engine import engine_options, sqlite_pragmas
+from app.influx.cache import QueryCache
+from app.ingest.commands import CommandDispatcher
+from app.ingest.device_cache import DeviceCache
+from app.ingest.latest import LatestStore
+from app.ingest.schedules import ScheduleEngine
+from app.ingest.workers import WorkerPool
+from app.ingest.writer import PointWriter
+from app.scheduler import Scheduler
 from app.handlers.error_handlers import validation_error
 
 db = SQLAlchemy()
@@ -23,22 +34,62 @@ influx_db = InfluxDBClient(
     token=os.environ.get("INFLUXDB_TOKEN"),
     org=os.environ.get("INFLUXDB_ORG"),
 )
-
-
-def create_app(config_name: str = "default") -> Flask:
+point_writer = PointWriter(influx_db)
+device_cache = DeviceCache()
+worker_pool = WorkerPool()
+query_cache = QueryCache()
+latest_store = LatestStore(influx_db)
+scheduler = Scheduler()
+command_dispatcher = CommandDispatcher(mqtt, scheduler)
+schedule_engine = ScheduleEngine(scheduler, command_dispatcher)
+token_blocklist = TokenBlocklist(jwt, scheduler)
+
+
+def create_app(
+    config_name: str = "default",
+    ingest: bool = None,
+    schedules: bool = None,
+    mqtt_enabled: bool = None,
+) -> Flask:
     app = Flask(__name__)
-    CORS(app)
+    CORS(app, expose_headers=["X-Next-Cursor"])
 
     app.config.from_object(config[config_name])
+    if ingest is not None:
+        app.config["MQTT_INGEST"] = ingest
+    if schedules is not None:
+        app.config["SCHEDULES_ENABLED"] = schedules
+    if mqtt_enabled is not None:
+        app.config["MQTT_ENABLED"] = mqtt_enabled
+    app.config.setdefault(
+        "SQLALCHEMY_ENGINE_OPTIONS",
+        engine_options(app.config.get("SQLALCHEMY_DATABASE_URI"), app.config),
+    )
 
     db.init_app(app)
+    with app.app_context():
+        if db.engine.dialect.name == "sqlite":
+            event.listen(db.engine, "connect", sqlite_pragmas)
     jwt.init_app(app)
+    token_blocklist.init_app(app)
     ma.init_app(app)
     migrate.init_app(app, db)
+    point_writer.init_app(app)
+    device_cache.init_app(app)
+    worker_pool.init_app(app)
+    query_cache.init_app(app)
+    latest_store.init_app(app)
+    scheduler.init_app(app)
+    command_dispatcher.init_app(app)
+    schedule_engine.init_app(app)
 
     from app.resources.device import DeviceRegister, DeviceList, Device
-    from app.resources.data import Data
+    from app.resources.command import Command
+    from app.resources.data import Data, RoomData
+    from app.resources.latest import DeviceLatest, RoomLatest, Latest
+    from app.resources.stats import Stats
     from app.resources.room import RoomList, Room
+    from app.resources.schedule import ScheduleList, Schedule
     from app.resources.user import UserRegister, UserLogin, UserLogout, User
 
     api = Api(app, version="1.0", title="Mokki API")
@@ -52,6 +103,19 @@ def create_app(config_name: str = "default") -> Flask:
     api.add_resource(DeviceList, "/rooms/<int:room_id>/devices")
     api.add_resource(Device, "/devices/<int:device_id>")
     api.add_resource(Data, "/devices/<int:device_id>/data")
+    api.add_resource(RoomData, "/rooms/<int:room_id>/data")
+
+    # Latest readings
+    api.add_resource(Latest, "/latest")
+    api.add_resource(RoomLatest, "/rooms/<int:room_id>/latest")
+    api.add_resource(DeviceLatest, "/devices/<int:device_id>/latest")
+
+    # Commands
+    api.add_resource(Command, "/commands/<int:command_id>")
+
+    # Schedules
+    api.add_resource(ScheduleList, "/schedules")
+    api.add_resource(Schedule, "/schedules/<int:schedule_id>")
 
     # Users
     api.add_resource(UserRegister, "/users")
@@ -59,11 +123,20 @@ def create_app(config_name: str = "default") -> Flask:
     api.add_resource(UserLogout, "/auth/logout")
     api.add_resource(User, "/users/<int:user_id>")
 
+    # Stats
+    api.add_resource(Stats, "/ingest/stats")
+
     app.register_error_handler(400, validation_error)
 
+    from app.cli import rollups_cli, uids_cli
+
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(uids_cli)
+
     from app.handlers import mqtt_handlers
 
-    if not mqtt.connected:
+    # web workers behind gunicorn leave the broker to the ingest consumers
+    if app.config["MQTT_ENABLED"] and not mqtt.connected:
         mqtt.init_app(app)
         mqtt.app = app
 
@@ -1 +1,253 @@
-BLOCKLIST = set()
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from flask import Flask
+from flask_jwt_extended import JWTManager
+from sqlalchemy import inspect
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.scheduler import Scheduler
+
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class BloomFilter:
+    """Fixed-size set of strings with false positives but no false negatives."""
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class TokenBlocklist:
+    """Revoked access tokens shared by every worker through the database.
+
+    Each process keeps a Bloom filter of the revoked jtis in front of the
+    ``revoked_tokens`` table, so checking a token that was never revoked
+    costs no I/O. Tokens the filter reports are checked against the table
+    once and the answer is kept in an LRU of ``REVOKED_TOKENS_CACHE_SIZE``
+    entries.
+
+    The filter is loaded when the app is created. Revocations made by other
+    processes are read into it every ``REVOKED_TOKENS_SYNC_INTERVAL``
+    seconds on the scheduler thread, and every
+    ``REVOKED_TOKENS_REBUILD_INTERVAL`` seconds the rows of expired tokens
+    are deleted and the filter is rebuilt from the rest, so checking a
+    token never waits for a sync and memory stays at the filter size plus
+    the LRU however many tokens are revoked.
+    """
+
+    def __init__(
+        self, jwt: JWTManager, scheduler: Scheduler, app: Flask = None
+    ) -> None:
+        self.app = None
+        self.scheduler = scheduler
+        self.capacity = 100000
+        self.error_rate = 0.01
+        self.cache_size = 10000
+        self.sync_interval = 5
+        self.rebuild_interval = 3600
+
+        self._filter = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._synced_since = None
+        self._rebuilt_at = None
+        self._started = False
+
+        self.checks = 0
+        self.filtered = 0
+        self.cache_hits = 0
+        self.queries = 0
+        self.revoked = 0
+
+        jwt.token_in_blocklist_loader(self._check_token)
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        # the model is imported here so that its table is known to
+        # create_all and migrations, importing it above would be circular
+        from app.models import revoked_token
+
+        self.app = app
+        self.capacity = app.config.get("REVOKED_TOKENS_CAPACITY", self.capacity)
+        self.error_rate = app.config.get(
+            "REVOKED_TOKENS_FALSE_POSITIVE_RATE", self.error_rate
+        )
+        self.cache_size = app.config.get("REVOKED_TOKENS_CACHE_SIZE", self.cache_size)
+        self.sync_interval = app.config.get(
+            "REVOKED_TOKENS_SYNC_INTERVAL", self.sync_interval
+        )
+        self.rebuild_interval = app.config.get(
+            "REVOKED_TOKENS_REBUILD_INTERVAL", self.rebuild_interval
+        )
+
+        with self._lock:
+            self._filter = None
+            self._cache = OrderedDict()
+            self._rebuilt_at = None
+        self._started = False
+
+        with app.app_context():
+            try:
+                self._load()
+            except SQLAlchemyError as e:
+                # every token is checked against the table until a sync loads it
+                print(f"Failed to load revoked tokens: {e}")
+
+    def start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+        self.scheduler.call_later(
+            self.sync_interval, self.sync, key="revoked-tokens-sync"
+        )
+
+    def is_revoked(self, jti: str) -> bool:
+        self.checks += 1
+        if not self._started:
+            self.start()
+
+        bloom = self._filter
+        if bloom is not None and jti not in bloom:
+            self.filtered += 1
+            return False
+
+        with self._lock:
+            revoked = self._cache.get(jti)
+            if revoked is not None:
+                self._cache.move_to_end(jti)
+                self.cache_hits += 1
+                return revoked
+
+        from app.models.revoked_token import RevokedTokenModel
+
+        self.queries += 1
+        revoked = RevokedTokenModel.exists(jti)
+        self._remember(jti, revoked)
+        return revoked
+
+    def revoke(self, jti: str, expires: int = None) -> None:
+        """Revokes the token ``jti`` until ``expires`` (its ``exp`` claim)."""
+        from app import db
+        from app.models.revoked_token import RevokedTokenModel
+
+        expires_at = None
+        if expires is not None:
+            expires_at = datetime.fromtimestamp(expires, timezone.utc).replace(
+                tzinfo=None
+            )
+
+        db.session.merge(RevokedTokenModel(jti=jti, expires_at=expires_at))
+        db.session.commit()
+        self.revoked += 1
+
+        bloom = self._filter
+        if bloom is not None:
+            bloom.add(jti)
+        self._remember(jti, True)
+
+    def sync(self) -> None:
+        """Reads the tokens revoked by other processes, run by the scheduler."""
+        try:
+            if (
+                self._filter is None
+                or time.monotonic() - self._rebuilt_at >= self.rebuild_interval
+            ):
+                self._rebuild(purge=True)
+            else:
+                self._read_new()
+        finally:
+            self.scheduler.call_later(
+                self.sync_interval, self.sync, key="revoked-tokens-sync"
+            )
+
+    def stats(self) -> dict:
+        return {
+            "checks": self.checks,
+            "filtered": self.filtered,
+            "cache_hits": self.cache_hits,
+            "queries": self.queries,
+            "revoked": self.revoked,
+            "cached": len(self._cache),
+        }
+
+    def _check_token(self, jwt_header: dict, jwt_payload: dict) -> bool:
+        return self.is_revoked(jwt_payload["jti"])
+
+    def _load(self) -> None:
+        from app import db
+        from app.models.command import utcnow
+        from app.models.revoked_token import RevokedTokenModel
+
+        if inspect(db.engine).has_table(RevokedTokenModel.__tablename__):
+            self._rebuild(purge=False)
+            return
+
+        # before the first migration no token can have been revoked
+        with self._lock:
+            self._filter = BloomFilter(self.capacity, self.error_rate)
+        self._synced_since = utcnow()
+        self._rebuilt_at = time.monotonic()
+
+    def _rebuild(self, purge: bool) -> None:
+        from app.models.command import utcnow
+        from app.models.revoked_token import RevokedTokenModel
+
+        since = utcnow()
+        if purge:
+            RevokedTokenModel.delete_expired()
+
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        for jti in RevokedTokenModel.find_jtis():
+            bloom.add(jti)
+
+        with self._lock:
+            self._filter = bloom
+            self._cache = OrderedDict()
+        self._synced_since = since
+        self._rebuilt_at = time.monotonic()
+
+    def _read_new(self) -> None:
+        from app.models.command import utcnow
+        from app.models.revoked_token import RevokedTokenModel
+
+        since = utcnow()
+        # the overlap covers commits that land after a sync with older times
+        for jti in RevokedTokenModel.find_jtis(self._synced_since - SYNC_OVERLAP):
+            self._filter.add(jti)
+            with self._lock:
+                if self._cache.get(jti) is False:
+                    del self._cache[jti]
+        self._synced_since = since
+
+    def _remember(self, jti: str, revoked: bool) -> None:
+        with self._lock:
+            self._cache[jti] = revoked
+            self._cache.move_to_end(jti)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
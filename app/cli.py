@@ -0,0 +1,159 @@
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from influxdb_client import BucketRetentionRules
+from influxdb_client.domain.task_create_request import TaskCreateRequest
+
+from app import influx_db
+from app.influx.query import parse_duration
+from app.influx.rollups import (
+    configured_rollups,
+    rollup_bucket,
+    rollup_flux,
+    rollup_task_flux,
+)
+from app.provisioning import SoftwareEncryptor, TpmEncryptor, provision
+
+rollups_cli = AppGroup("rollups", help="Manage the downsampled InfluxDB rollups.")
+uids_cli = AppGroup("uids", help="Manage the device secrets.")
+
+
+def retention_rules(retention) -> list:
+    if retention is None:
+        return []
+    return [
+        BucketRetentionRules(
+            type="expire", every_seconds=int(retention.total_seconds())
+        )
+    ]
+
+
+@rollups_cli.command("create")
+@click.option(
+    "--raw-retention",
+    help="Also shorten the retention of the raw bucket, e.g. 30d.",
+)
+def create_rollups(raw_retention: str) -> None:
+    """Creates the rollup buckets and the tasks that fill them."""
+    bucket = current_app.config["INFLUXDB_BUCKET"]
+    org = current_app.config["INFLUXDB_ORG"]
+    buckets_api = influx_db.buckets_api()
+    tasks_api = influx_db.tasks_api()
+
+    for rollup in current_app.config["INFLUXDB_ROLLUPS"]:
+        name = rollup_bucket(bucket, rollup["every"])
+        retention = rollup.get("retention")
+
+        if buckets_api.find_bucket_by_name(name) is None:
+            buckets_api.create_bucket(
+                bucket_name=name,
+                retention_rules=retention_rules(
+                    parse_duration(retention) if retention else None
+                ),
+                org=org,
+            )
+            click.echo(f"Created bucket {name}")
+
+        if not tasks_api.find_tasks(name=name):
+            tasks_api.create_task(
+                task_create_request=TaskCreateRequest(
+                    org=org,
+                    status="active",
+                    flux=rollup_task_flux(bucket, org, rollup["every"]),
+                    description=f"Rollup of {bucket} every {rollup['every']}",
+                )
+            )
+            click.echo(f"Created task {name}")
+
+    if raw_retention:
+        raw = buckets_api.find_bucket_by_name(bucket)
+        raw.retention_rules = retention_rules(parse_duration(raw_retention))
+        buckets_api.update_bucket(raw)
+        click.echo(f"Set retention of {bucket} to {raw_retention}")
+
+
+@rollups_cli.command("list")
+def list_rollups() -> None:
+    """Shows the configured rollups and whether their bucket and task exist."""
+    buckets_api = influx_db.buckets_api()
+    tasks_api = influx_db.tasks_api()
+
+    for name, every, retention in configured_rollups(current_app.config):
+        bucket = "present" if buckets_api.find_bucket_by_name(name) else "missing"
+        tasks = tasks_api.find_tasks(name=name)
+        task = tasks[0].status if tasks else "missing"
+        click.echo(
+            f"{name}: every {every}, retention {retention or 'forever'}, "
+            f"bucket {bucket}, task {task}"
+        )
+
+
+@rollups_cli.command("delete")
+@click.confirmation_option(prompt="Delete all rollup buckets and tasks?")
+def delete_rollups() -> None:
+    """Deletes the rollup tasks and buckets."""
+    buckets_api = influx_db.buckets_api()
+    tasks_api = influx_db.tasks_api()
+
+    for name, every, retention in configured_rollups(current_app.config):
+        for task in tasks_api.find_tasks(name=name):
+            tasks_api.delete_task(task.id)
+            click.echo(f"Deleted task {name}")
+
+        bucket = buckets_api.find_bucket_by_name(name)
+        if bucket is not None:
+            buckets_api.delete_bucket(bucket)
+            click.echo(f"Deleted bucket {name}")
+
+
+@rollups_cli.command("backfill")
+@click.option("--start", default="-30d", help="Start of the range to roll up.")
+def backfill_rollups(start: str) -> None:
+    """Rolls up the raw data written before the tasks existed."""
+    bucket = current_app.config["INFLUXDB_BUCKET"]
+    org = current_app.config["INFLUXDB_ORG"]
+    query_api = influx_db.query_api()
+
+    for rollup in current_app.config["INFLUXDB_ROLLUPS"]:
+        query_api.query(rollup_flux(bucket, org, rollup["every"], start), org=org)
+        click.echo(f"Backfilled {rollup_bucket(bucket, rollup['every'])}")
+
+
+@uids_cli.command("provision")
+@click.argument("count", type=click.IntRange(min=1))
+@click.option(
+    "--output",
+    default="secrets",
+    show_default=True,
+    help="Directory for the encrypted secrets.",
+)
+@click.option(
+    "--software-key",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Encrypt with this PEM public key instead of the TPM.",
+)
+@click.option(
+    "--mapping",
+    type=click.Path(dir_okay=False),
+    help="Also write the serial and uid of every secret to this CSV file. "
+    "It holds the plain secrets, keep it away from the encrypted files.",
+)
+def provision_uids(count: int, output: str, software_key: str, mapping: str) -> None:
+    """Generates COUNT device secrets and stores their unique IDs."""
+    if software_key:
+        encryptor = SoftwareEncryptor(software_key)
+    else:
+        encryptor = TpmEncryptor(current_app.config["PERSISTENT_HANDLE"])
+
+    started = time.perf_counter()
+    try:
+        serials = provision(count, output, encryptor, mapping)
+    finally:
+        encryptor.close()
+
+    click.echo(
+        f"Provisioned {len(serials)} secrets into {output} "
+        f"in {time.perf_counter() - started:.2f}s"
+    )
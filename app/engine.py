@@ -0,0 +1,26 @@
+from sqlalchemy.engine import make_url
+
+
+def engine_options(uri: str, config) -> dict:
+    """SQLAlchemy engine options tuned for the database backend of ``uri``."""
+    if not uri:
+        return {}
+
+    if make_url(uri).get_backend_name() == "sqlite":
+        # waiting for the lock beats failing with "database is locked"
+        return {"connect_args": {"timeout": config["SQLITE_BUSY_TIMEOUT"]}}
+
+    return {
+        "pool_size": config["DB_POOL_SIZE"],
+        "max_overflow": config["DB_MAX_OVERFLOW"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+        "pool_pre_ping": True,
+    }
+
+
+def sqlite_pragmas(connection, record) -> None:
+    """Lets SQLite readers run alongside a writer and commit without fsync."""
+    cursor = connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
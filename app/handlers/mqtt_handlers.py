@@ -1,40 +1,94 @@
-import json
+import time
 from influxdb_client import Point
-from influxdb_client.client.write_api import SYNCHRONOUS
 
-from app import mqtt, influx_db
-from app.models.device import DeviceModel
+from app import (
+    mqtt,
+    point_writer,
+    device_cache,
+    worker_pool,
+    query_cache,
+    latest_store,
+    command_dispatcher,
+    schedule_engine,
+)
+from app.ingest.codecs import decode_samples
 
 
 @mqtt.on_connect()
 def handle_connect(client, userdata, flags, rc):
-    mqtt.subscribe("data/#")
+    if not mqtt.app.config["MQTT_INGEST"]:
+        return
+
+    device_cache.warm()
+
+    # consumers in the same group share the readings instead of each
+    # receiving (and writing) every one of them
+    group = mqtt.app.config["MQTT_SHARED_GROUP"]
+    mqtt.subscribe(f"$share/{group}/data/+" if group else "data/+")
+    mqtt.subscribe(f"$share/{group}/ack/+" if group else "ack/+", qos=1)
+
+    command_dispatcher.start()
+    if mqtt.app.config["SCHEDULES_ENABLED"]:
+        schedule_engine.start()
 
 
 @mqtt.on_message()
 def handle_message(client, userdata, message):
+    # keep the network thread free, the topic identifies the device so
+    # readings from one device are still processed in order
+    worker_pool.submit(message.topic, message.topic, message.payload, time.time_ns())
+
+
+@worker_pool.on_task()
+def process_message(topic, payload, received):
+    if topic.startswith("ack/"):
+        command_dispatcher.acknowledge(topic.split("/")[1], payload)
+        return
+
     try:
-        uid = message.topic.split("/")[1]
-        payload = message.payload.decode()
-        data = json.loads(payload)
+        uid = topic.split("/")[1]
+        samples = decode_samples(payload)
     except:
         return
 
-    with mqtt.app.app_context():
-        device = DeviceModel.find_by_uid(uid)
-        if not device:
-            print("No such device")
-            return
+    if device_cache.get(uid) is None:
+        print("No such device")
+        return
+
+    # samples without a device timestamp get the arrival time, and samples
+    # from a device whose clock runs ahead are dropped
+    latest = received + int(mqtt.app.config["INGEST_MAX_CLOCK_SKEW"] * 1e9)
+
+    points = []
+    newest = None
+    for sample in samples:
+        timestamp, temperature, humidity, light_level = sample
+        timestamp = int(timestamp * 1e9) if timestamp is not None else received
+        if timestamp > latest:
+            continue
+        if newest is None or timestamp > newest[0]:
+            newest = (timestamp, temperature, humidity, light_level)
 
-        point = (
+        points.append(
             Point("sensor_data")
-            .tag("device", device.uid)
-            .field("temperature", data["temperature"])
-            .field("humidity", data["humidity"])
-            .field("light_level", data["light_level"])
+            .tag("device", uid)
+            .field("temperature", temperature)
+            .field("humidity", humidity)
+            .field("light_level", light_level)
+            .time(timestamp)
         )
 
-        # print(point)
+    point_writer.write(*points)
+    query_cache.invalidate(uid)
 
-        write_api = influx_db.write_api(write_options=SYNCHRONOUS)
-        write_api.write(bucket="mokki", org="sensec", record=point)
+    if newest:
+        timestamp, temperature, humidity, light_level = newest
+        latest_store.update(
+            uid,
+            timestamp,
+            {
+                "temperature": temperature,
+                "humidity": humidity,
+                "light_level": light_level,
+            },
+        )
@@ -0,0 +1,145 @@
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from flask import Flask
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class QueryCache:
+    """LRU cache of data query results with a TTL that scales with the range.
+
+    The TTL grows with the range length (``QUERY_CACHE_TTL_RATIO``).
+    ``align`` rounds a range out to multiples of the TTL, so keys built
+    from it let requests for "-1h" made a few seconds apart share one
+    entry. Entries whose range reaches the present are "recent" and are
+    dropped as soon as a new reading arrives for their device through
+    ``invalidate``.
+    """
+
+    def __init__(self, app: Flask = None) -> None:
+        self.max_bytes = 64 * 1024 * 1024
+        self.max_entries = 10000
+        self.min_ttl = 5
+        self.max_ttl = 3600
+        self.ttl_ratio = 1 / 60
+
+        self._entries = OrderedDict()
+        self._recent = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self.max_bytes = app.config.get("QUERY_CACHE_MAX_BYTES", self.max_bytes)
+        self.max_entries = app.config.get("QUERY_CACHE_MAX_ENTRIES", self.max_entries)
+        self.min_ttl = app.config.get("QUERY_CACHE_MIN_TTL", self.min_ttl)
+        self.max_ttl = app.config.get("QUERY_CACHE_MAX_TTL", self.max_ttl)
+        self.ttl_ratio = app.config.get("QUERY_CACHE_TTL_RATIO", self.ttl_ratio)
+        self.clear()
+
+    def ttl(self, start: datetime, stop: datetime) -> float:
+        ttl = (stop - start).total_seconds() * self.ttl_ratio
+        return min(max(ttl, self.min_ttl), self.max_ttl)
+
+    def align(self, start: datetime, stop: datetime, window: timedelta = None):
+        """Widens a range to bucket boundaries and returns (start, stop, ttl)."""
+        ttl = self.ttl(start, stop)
+
+        bucket = ttl
+        if window:
+            bucket = max(bucket, window.total_seconds())
+
+        start = (start - EPOCH).total_seconds()
+        stop = (stop - EPOCH).total_seconds()
+        start = EPOCH + timedelta(seconds=math.floor(start / bucket) * bucket)
+        stop = EPOCH + timedelta(seconds=math.ceil(stop / bucket) * bucket)
+
+        return start, stop, ttl
+
+    def get(self, key: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, uids: list, key: tuple, value, stop: datetime, ttl: float) -> None:
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            recent = stop >= datetime.now(timezone.utc)
+            self._entries[key] = (time.monotonic() + ttl, value, size, uids, recent)
+            self.bytes += size
+            if recent:
+                for uid in uids:
+                    self._recent.setdefault(uid, set()).add(key)
+
+            while self._entries and (
+                self.bytes > self.max_bytes or len(self._entries) > self.max_entries
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, uid: str) -> None:
+        if uid not in self._recent:
+            return
+
+        with self._lock:
+            for key in self._recent.pop(uid, ()):
+                if key in self._entries:
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = OrderedDict()
+            self._recent = {}
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, key: tuple) -> None:
+        expires, value, size, uids, recent = self._entries.pop(key)
+        self.bytes -= size
+        if not recent:
+            return
+
+        for uid in uids:
+            if uid in self._recent:
+                self._recent[uid].discard(key)
+                if not self._recent[uid]:
+                    del self._recent[uid]
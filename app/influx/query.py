@@ -0,0 +1,183 @@
+import math
+import re
+from datetime import datetime, timedelta, timezone
+
+MEASUREMENT = "sensor_data"
+FIELDS = ("temperature", "humidity", "light_level")
+AGGREGATES = ("mean", "min", "max", "last")
+
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+DURATION = re.compile(r"(\d+)(s|m|h|d|w)")
+
+
+def parse_duration(value: str) -> timedelta:
+    """Parses a Flux style duration such as "5m" or "1h30m"."""
+    position = 0
+    seconds = 0
+    for match in DURATION.finditer(value):
+        if match.start() != position:
+            break
+        seconds += int(match.group(1)) * UNITS[match.group(2)]
+        position = match.end()
+
+    if not value or position != len(value):
+        raise ValueError(f"Invalid duration '{value}'")
+
+    return timedelta(seconds=seconds)
+
+
+def parse_time(value: str, now: datetime) -> datetime:
+    """Parses "now()", a negative duration relative to now or an RFC3339 time."""
+    if value == "now()":
+        return now
+    if value.startswith("-"):
+        return now - parse_duration(value[1:])
+
+    try:
+        time = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid time '{value}'")
+
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=timezone.utc)
+    return time.astimezone(timezone.utc)
+
+
+def flux_time(time: datetime) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def flux_duration(duration: timedelta) -> str:
+    return f"{int(duration.total_seconds())}s"
+
+
+def choose_window(
+    start: datetime,
+    stop: datetime,
+    resolution: timedelta = None,
+    max_points: int = None,
+):
+    """Returns the aggregation window for a range, or None for raw points.
+
+    The window is the requested resolution, widened where needed so that no
+    series returns more than ``max_points`` points.
+    """
+    if resolution is None and max_points is None:
+        return None
+
+    window = resolution or timedelta(seconds=1)
+    if max_points:
+        seconds = math.ceil((stop - start).total_seconds() / max_points)
+        window = max(window, timedelta(seconds=seconds))
+
+    return max(window, timedelta(seconds=1))
+
+
+def build_query(
+    bucket: str,
+    uids: list,
+    start: datetime,
+    stop: datetime,
+    field: str = None,
+    window: timedelta = None,
+    aggregate: str = "mean",
+    limit: int = None,
+    pivot: bool = False,
+    rollup: str = None,
+    rollup_stop: datetime = None,
+    page_size: int = None,
+    after: tuple = None,
+) -> str:
+    """Builds the Flux query for the data endpoints.
+
+    With ``rollup`` the range is read from that rollup bucket, only the
+    series precomputed with ``aggregate``, before re-windowing them. With
+    ``rollup_stop`` as well the rollup is read until then and ``bucket``
+    after it, as floats like the rollup.
+
+    ``page_size`` returns the first points in (time, field) order, or the
+    first rows in time order when pivoting, that come after the
+    ``after`` = (time, field) cursor. Every series is cut to the page size
+    before the series are merged, so a page never reads more than
+    ``page_size`` points per field however long the range is.
+    """
+    if after:
+        start = max(start, after[0])
+
+    if len(uids) == 1:
+        device_filter = f'r.device == "{uids[0]}"'
+    else:
+        devices = ", ".join(f'"{uid}"' for uid in uids)
+        device_filter = f"contains(value: r.device, set: [{devices}])"
+
+    filters = (
+        f'|> filter(fn: (r) => r._measurement == "{MEASUREMENT}") '
+        f"|> filter(fn: (r) => {device_filter}) "
+    )
+
+    if field:
+        filters += f'|> filter(fn: (r) => r._field == "{field}") '
+
+    if rollup:
+        query = (
+            f'from(bucket: "{rollup}") '
+            f"|> range(start: {flux_time(start)}, "
+            f"stop: {flux_time(rollup_stop or stop)}) "
+            f"{filters}"
+            f'|> filter(fn: (r) => r.agg == "{aggregate}") '
+            '|> drop(columns: ["agg"]) '
+        )
+        if rollup_stop:
+            query = (
+                f"union(tables: [{query}, "
+                f'from(bucket: "{bucket}") '
+                f"|> range(start: {flux_time(rollup_stop)}, stop: {flux_time(stop)}) "
+                f"{filters}"
+                "|> toFloat()]) "
+            )
+    else:
+        query = (
+            f'from(bucket: "{bucket}") '
+            f"|> range(start: {flux_time(start)}, stop: {flux_time(stop)}) "
+            f"{filters}"
+        )
+
+    if after:
+        # record times are read back with microsecond precision, so the
+        # cursor covers the whole microsecond
+        after_time, after_field = after
+        next_time = flux_time(after_time + timedelta(microseconds=1))
+        condition = f"r._time >= {next_time}"
+        if after_field and not pivot:
+            condition += f' or (r._time < {next_time} and r._field > "{after_field}")'
+        query += f"|> filter(fn: (r) => {condition}) "
+
+    if window:
+        query += (
+            f"|> aggregateWindow(every: {flux_duration(window)}, "
+            f"fn: {aggregate}, createEmpty: false) "
+        )
+
+    if rollup_stop:
+        # join the rollup and the raw windows of each series back together
+        query += (
+            '|> group(columns: ["_measurement", "_field", "device"]) '
+            '|> sort(columns: ["_time"]) '
+        )
+
+    if limit:
+        query += f"|> limit(n: {limit}) "
+
+    if page_size:
+        query += f"|> limit(n: {page_size}) "
+
+    if pivot:
+        query += (
+            '|> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value") '
+        )
+
+    if page_size:
+        columns = '["_time"]' if pivot else '["_time", "_field"]'
+        query += f"|> group() |> sort(columns: {columns}) |> limit(n: {page_size}) "
+
+    return query
@@ -0,0 +1,126 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+from app.influx.query import MEASUREMENT, parse_duration
+
+ROLLUP_AGGREGATES = ("mean", "min", "max")
+
+
+def rollup_bucket(bucket: str, every: str) -> str:
+    return f"{bucket}_{every}"
+
+
+def configured_rollups(config) -> list:
+    """Returns (bucket, every, retention) for each configured rollup, finest first.
+
+    ``every`` and ``retention`` are timedeltas, retention is None when the
+    rollup is kept forever.
+    """
+    rollups = []
+    for rollup in config["INFLUXDB_ROLLUPS"]:
+        retention = rollup.get("retention")
+        rollups.append(
+            (
+                rollup_bucket(config["INFLUXDB_BUCKET"], rollup["every"]),
+                parse_duration(rollup["every"]),
+                parse_duration(retention) if retention else None,
+            )
+        )
+    return sorted(rollups, key=lambda rollup: rollup[1])
+
+
+def rollup_flux(bucket: str, org: str, every: str, start: str) -> str:
+    """Flux that writes mean, min and max windows of the raw data into a rollup.
+
+    Windows are stamped with their start time and rewriting a window only
+    overwrites the same points, so the script can safely be run repeatedly
+    over overlapping ranges. Every field is converted to float first: the
+    aggregates share one field key per series and light_level is raw
+    integers, so min and max would otherwise clash with the float mean.
+    """
+    target = rollup_bucket(bucket, every)
+    flux = (
+        f'data = from(bucket: "{bucket}")\n'
+        f"    |> range(start: {start})\n"
+        f'    |> filter(fn: (r) => r._measurement == "{MEASUREMENT}")\n'
+        "    |> toFloat()\n"
+    )
+    for aggregate in ROLLUP_AGGREGATES:
+        flux += (
+            f"\ndata\n"
+            f"    |> aggregateWindow(every: {every}, fn: {aggregate}, "
+            f'createEmpty: false, timeSrc: "_start")\n'
+            f'    |> set(key: "agg", value: "{aggregate}")\n'
+            f'    |> to(bucket: "{target}", org: "{org}", '
+            f'tagColumns: ["device", "agg"])\n'
+        )
+    return flux
+
+
+def rollup_task_flux(bucket: str, org: str, every: str) -> str:
+    """Task that refreshes the current and the previous window every period."""
+    start = f"-{int(parse_duration(every).total_seconds()) * 2}s"
+    return (
+        f'option task = {{name: "{rollup_bucket(bucket, every)}", every: {every}}}\n\n'
+        + rollup_flux(bucket, org, every, start)
+    )
+
+
+def floor_time(time: datetime, every: timedelta) -> datetime:
+    """Rounds ``time`` down to a multiple of ``every`` since the epoch."""
+    seconds = every.total_seconds()
+    return datetime.fromtimestamp(time.timestamp() // seconds * seconds, timezone.utc)
+
+
+def choose_rollup(
+    config,
+    start: datetime,
+    stop: datetime,
+    window: timedelta,
+    aggregate: str,
+    exact: bool,
+):
+    """Picks the coarsest rollup that can answer an aggregated query.
+
+    Returns (bucket, window, rollup_stop). The bucket is None when the raw
+    data has to be queried. A rollup qualifies when its period fits in the
+    window and its retention covers the start of the range. When the window
+    was derived from a point budget (``exact`` is False) it is rounded up
+    to a multiple of the rollup period, otherwise the period has to divide
+    it.
+
+    The task of a rollup only writes completed periods and the latest run
+    may not have finished yet, so a range reaching the last two periods
+    reads the rollup until ``rollup_stop`` and the raw bucket after it.
+    ``rollup_stop`` is aligned to the window so that no window mixes both,
+    and is None when the rollup covers the whole range.
+    """
+    if (
+        not config.get("INFLUXDB_ROLLUPS_ENABLED")
+        or window is None
+        or aggregate not in ROLLUP_AGGREGATES
+    ):
+        return None, window, None
+
+    now = datetime.now(timezone.utc)
+    for bucket, every, retention in reversed(configured_rollups(config)):
+        if every > window:
+            continue
+        if retention and start < now - retention:
+            continue
+
+        rollup_window = window
+        remainder = window.total_seconds() % every.total_seconds()
+        if remainder:
+            if exact:
+                continue
+            periods = math.ceil(window.total_seconds() / every.total_seconds())
+            rollup_window = every * periods
+
+        rollup_stop = floor_time(floor_time(now, every) - every, rollup_window)
+        if rollup_stop <= start:
+            continue
+
+        return bucket, rollup_window, rollup_stop if rollup_stop < stop else None
+
+    return None, window, None
@@ -0,0 +1,61 @@
+import json
+import struct
+
+# Devices pick the wire format per message. JSON payloads are either one
+# reading or an array of readings:
+#
+#   {"temperature": 21.5, "humidity": 40.2, "light_level": 5123}
+#   [{"timestamp": 1700000000, "temperature": 21.5, ...}, ...]
+#
+# Packed payloads start with a version byte (all values little-endian):
+#
+#   0x01  one reading: float32 temperature, float32 humidity,
+#         uint16 light_level (11 bytes in total)
+#   0x02  any number of readings, each a uint32 unix timestamp followed by
+#         the same three values (14 bytes per reading)
+#
+# Decoded samples are (timestamp, temperature, humidity, light_level)
+# tuples where timestamp is in seconds, or None when the device did not
+# send one.
+PACKED_V1 = 0x01
+PACKED_V1_READING = struct.Struct("<ffH")
+PACKED_V2 = 0x02
+PACKED_V2_READING = struct.Struct("<IffH")
+
+
+def encode_packed(temperature: float, humidity: float, light_level: int) -> bytes:
+    return bytes((PACKED_V1,)) + PACKED_V1_READING.pack(
+        temperature, humidity, light_level
+    )
+
+
+def encode_packed_batch(samples) -> bytes:
+    return bytes((PACKED_V2,)) + b"".join(
+        PACKED_V2_READING.pack(*sample) for sample in samples
+    )
+
+
+def decode_samples(payload: bytes) -> list:
+    version = payload[:1]
+
+    if version == b"\x01":
+        return [(None, *PACKED_V1_READING.unpack_from(payload, 1))]
+
+    if version == b"\x02":
+        if (len(payload) - 1) % PACKED_V2_READING.size:
+            raise ValueError("Truncated packed payload")
+        return list(PACKED_V2_READING.iter_unpack(payload[1:]))
+
+    data = json.loads(payload)
+    if isinstance(data, dict):
+        data = [data]
+
+    return [
+        (
+            sample.get("timestamp"),
+            sample["temperature"],
+            sample["humidity"],
+            sample["light_level"],
+        )
+        for sample in data
+    ]
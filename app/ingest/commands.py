@@ -0,0 +1,367 @@
+import json
+import threading
+import time
+from datetime import timedelta
+
+from flask import Flask
+from flask_mqtt import Mqtt
+
+from app.scheduler import Scheduler
+
+
+class CommandDispatcher:
+    """Publishes device commands and tracks their acknowledgements.
+
+    Commands are rows of the ``commands`` table. ``send`` commits them and
+    publishes them with ``COMMAND_QOS`` without waiting for the broker, and
+    devices acknowledge them by publishing ``{"id": <command id>}`` to
+    ``ack/<uid>``. The new setpoint is stored on the device only once the
+    acknowledgement arrives. Ingest processes call ``start`` to run a
+    thread that resends unacknowledged commands after ``COMMAND_RETRY_DELAY``
+    seconds, doubling the delay every attempt, and gives up after
+    ``COMMAND_MAX_ATTEMPTS``. Every resend is claimed with a conditional
+    UPDATE, so several ingest processes never resend the same attempt.
+    A new command supersedes the pending ones of its device in the same
+    transaction, so an older setpoint is never resent after it, and late
+    acknowledgements of older commands are ignored.
+
+    ``send_coalesced`` is for setpoints that change in bursts. The first
+    call for a device inserts the command and the following calls within
+    ``COMMAND_COALESCE_WINDOW`` seconds only replace its temperature in
+    memory. When the window closes the scheduler stores and publishes the
+    last temperature once. Should the process die before that, the retry
+    thread publishes the command as first stored. A command sent through
+    ``send`` meanwhile, for the room or by a schedule, supersedes the
+    coalesced one and closes its window.
+
+    Processes without a broker connection (``MQTT_ENABLED`` off) only store
+    commands as due at once, and the retry thread of an ingest process
+    publishes them.
+    """
+
+    def __init__(self, mqtt: Mqtt, scheduler: Scheduler, app: Flask = None) -> None:
+        self.mqtt = mqtt
+        self.scheduler = scheduler
+        self.app = None
+        self.qos = 1
+        self.mqtt_enabled = True
+        self.coalesce_window = 0.5
+        self.retry_delay = 10
+        self.retry_backoff = 2
+        self.retry_max_delay = 300
+        self.max_attempts = 5
+        self.poll_interval = 1.0
+        self.batch_size = 100
+
+        self._thread = None
+        self._lock = threading.Lock()
+        self._pending = {}
+
+        self.published = 0
+        self.coalesced = 0
+        self.retried = 0
+        self.acknowledged = 0
+        self.failed = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self.app = app
+        self.qos = app.config.get("COMMAND_QOS", self.qos)
+        self.mqtt_enabled = app.config.get("MQTT_ENABLED", self.mqtt_enabled)
+        self.coalesce_window = app.config.get(
+            "COMMAND_COALESCE_WINDOW", self.coalesce_window
+        )
+        self.retry_delay = app.config.get("COMMAND_RETRY_DELAY", self.retry_delay)
+        self.retry_backoff = app.config.get("COMMAND_RETRY_BACKOFF", self.retry_backoff)
+        self.retry_max_delay = app.config.get(
+            "COMMAND_RETRY_MAX_DELAY", self.retry_max_delay
+        )
+        self.max_attempts = app.config.get("COMMAND_MAX_ATTEMPTS", self.max_attempts)
+        self.poll_interval = app.config.get(
+            "COMMAND_RETRY_POLL_INTERVAL", self.poll_interval
+        )
+
+    def send(self, commands: list, uids: list) -> None:
+        """Commits new commands in one transaction and publishes them.
+
+        There is one command per device. The commands are inserted with one
+        INSERT that returns their ids and stay out of the session, so
+        reading them afterwards costs no query however many there are.
+        """
+        from app import db
+        from app.models.command import CommandModel, PENDING, utcnow
+
+        # coalesced commands still in their window are superseded below
+        with self._lock:
+            for command in commands:
+                pending = self._pending.get(command.device_id)
+                if pending is not None and pending["id"] is not None:
+                    del self._pending[command.device_id]
+                    self.scheduler.cancel(("command", command.device_id))
+
+        now = utcnow()
+        for command in commands:
+            command.status = PENDING
+            command.created_at = now
+            if self.mqtt_enabled:
+                command.attempts = 1
+                command.next_attempt_at = now + self._delay(1)
+            else:
+                command.attempts = 0
+                command.next_attempt_at = now
+
+        columns = (
+            "device_id",
+            "temperature",
+            "status",
+            "attempts",
+            "created_at",
+            "next_attempt_at",
+        )
+        rows = [
+            {column: getattr(command, column) for column in columns}
+            for command in commands
+        ]
+        try:
+            CommandModel.supersede([command.device_id for command in commands])
+            result = db.session.execute(
+                db.insert(CommandModel).returning(
+                    CommandModel.id, CommandModel.device_id
+                ),
+                rows,
+            )
+            ids = {row.device_id: row.id for row in result}
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        # RETURNING rows of a batch come in no set order, a send has one
+        # command per device
+        for command in commands:
+            command.id = ids[command.device_id]
+
+        if not self.mqtt_enabled:
+            return
+
+        for command, uid in zip(commands, uids):
+            self._publish(uid, command.payload())
+
+    def send_coalesced(self, device_id: int, uid: str, temperature: int) -> int:
+        """Sends the last temperature set within the coalescing window.
+
+        Returns the id of the command, which is shared by every call made
+        within the same window.
+        """
+        from app import db
+        from app.models.command import CommandModel, utcnow
+
+        if not self.coalesce_window:
+            command = CommandModel(device_id=device_id, temperature=temperature)
+            self.send([command], [uid])
+            return command.id
+
+        inserting = False
+        with self._lock:
+            pending = self._pending.get(device_id)
+            if pending is not None:
+                pending["temperature"] = temperature
+                self.coalesced += 1
+            else:
+                # reserved before the insert so that concurrent calls for
+                # the device join this command instead of inserting another
+                pending = {
+                    "id": None,
+                    "uid": uid,
+                    "temperature": temperature,
+                    "inserted": threading.Event(),
+                }
+                self._pending[device_id] = pending
+                inserting = True
+
+        if not inserting:
+            pending["inserted"].wait()
+            if pending["id"] is None:
+                # the insert failed, try again with a new command
+                return self.send_coalesced(device_id, uid, temperature)
+            return pending["id"]
+
+        command = CommandModel(
+            device_id=device_id,
+            temperature=temperature,
+            next_attempt_at=utcnow()
+            + timedelta(seconds=self.coalesce_window)
+            + self._delay(1),
+        )
+        try:
+            CommandModel.supersede([device_id])
+            db.session.add(command)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                del self._pending[device_id]
+            pending["inserted"].set()
+            raise
+
+        pending["id"] = command.id
+        pending["inserted"].set()
+        self.scheduler.call_later(
+            self.coalesce_window,
+            self._flush,
+            device_id,
+            pending,
+            key=("command", device_id),
+        )
+        return command.id
+
+    def acknowledge(self, uid: str, payload: bytes) -> None:
+        from app import db
+        from app.models.command import (
+            CommandModel,
+            PENDING,
+            ACKNOWLEDGED,
+            SUPERSEDED,
+            utcnow,
+        )
+        from app.models.device import DeviceModel
+
+        try:
+            command_id = int(json.loads(payload)["id"])
+        except (ValueError, KeyError, TypeError):
+            return
+
+        row = (
+            db.session.query(CommandModel, DeviceModel)
+            .join(DeviceModel, DeviceModel.id == CommandModel.device_id)
+            .filter(CommandModel.id == command_id, DeviceModel.uid == uid)
+            .first()
+        )
+        if row is None:
+            return
+
+        command, device = row
+        if command.status != PENDING:
+            return
+
+        # a newer setpoint acknowledged first keeps its temperature
+        newer = db.session.query(
+            db.exists().where(
+                CommandModel.device_id == device.id,
+                CommandModel.status == ACKNOWLEDGED,
+                CommandModel.id > command.id,
+            )
+        ).scalar()
+        if newer:
+            command.status = SUPERSEDED
+        else:
+            command.status = ACKNOWLEDGED
+            command.acknowledged_at = utcnow()
+            device.temperature = command.temperature
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self.acknowledged += 1
+
+    def retry_due(self) -> None:
+        from app import db
+        from app.models.command import CommandModel, PENDING, FAILED, utcnow
+
+        now = utcnow()
+        for command, uid in CommandModel.find_due(now, self.batch_size):
+            attempts = command.attempts
+            if attempts >= self.max_attempts:
+                values = {"status": FAILED}
+            else:
+                values = {
+                    "attempts": attempts + 1,
+                    "next_attempt_at": now + self._delay(attempts + 1),
+                }
+
+            claimed = CommandModel.query.filter_by(
+                id=command.id, status=PENDING, attempts=attempts
+            ).update(values, synchronize_session=False)
+            db.session.commit()
+            if not claimed:
+                continue
+
+            if attempts >= self.max_attempts:
+                self.failed += 1
+            else:
+                self._publish(uid, command.payload())
+                self.retried += 1
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            self._thread = threading.Thread(
+                target=self._run, name="command-retry", daemon=True
+            )
+            self._thread.start()
+
+    def stats(self) -> dict:
+        return {
+            "published": self.published,
+            "coalesced": self.coalesced,
+            "retried": self.retried,
+            "acknowledged": self.acknowledged,
+            "failed": self.failed,
+        }
+
+    def _run(self) -> None:
+        from app import db
+
+        with self.app.app_context():
+            while True:
+                time.sleep(self.poll_interval)
+                try:
+                    self.retry_due()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Failed to resend commands: {e}")
+
+    def _flush(self, device_id: int, pending: dict) -> None:
+        from app import db
+        from app.models.command import CommandModel, PENDING, utcnow
+
+        with self._lock:
+            if self._pending.get(device_id) is pending:
+                del self._pending[device_id]
+
+        if self.mqtt_enabled:
+            values = {"attempts": 1, "next_attempt_at": utcnow() + self._delay(1)}
+        else:
+            values = {"next_attempt_at": utcnow()}
+
+        # the retry thread may have claimed the command if this ran late,
+        # and a newer command may have superseded it
+        claimed = CommandModel.query.filter_by(
+            id=pending["id"], status=PENDING, attempts=0
+        ).update(
+            {"temperature": pending["temperature"], **values},
+            synchronize_session=False,
+        )
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        if claimed and self.mqtt_enabled:
+            self._publish(
+                pending["uid"],
+                {"id": pending["id"], "set_temperature": str(pending["temperature"])},
+            )
+
+    def _publish(self, uid: str, payload: dict) -> None:
+        self.mqtt.publish(f"command/{uid}", json.dumps(payload), self.qos)
+        self.published += 1
+
+    def _delay(self, attempt: int) -> timedelta:
+        delay = self.retry_delay * self.retry_backoff ** (attempt - 1)
+        return timedelta(seconds=min(delay, self.retry_max_delay))
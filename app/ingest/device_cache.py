@@ -0,0 +1,130 @@
+import threading
+import time
+
+from flask import Flask
+
+
+class DeviceCache:
+    """Process-local uid -> device id index for the ingest hot path.
+
+    The whole ``devices`` table is loaded with one query on first use and
+    reloaded every ``DEVICE_CACHE_REFRESH_INTERVAL`` seconds, so changes made
+    by other processes are picked up eventually. Changes made in this
+    process are applied immediately through ``add`` and ``discard``.
+    Unknown uids are remembered for ``DEVICE_CACHE_NEGATIVE_TTL`` seconds so
+    that a publisher sending garbage uids costs at most one query per uid
+    and TTL.
+    """
+
+    def __init__(self, app: Flask = None) -> None:
+        self.app = None
+        self.negative_ttl = 60
+        self.refresh_interval = 300
+        self.max_unknown = 10000
+
+        self._devices = {}
+        self._unknown = {}
+        self._lock = threading.Lock()
+        self._warmed_at = None
+
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.queries = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self.app = app
+        self.negative_ttl = app.config.get(
+            "DEVICE_CACHE_NEGATIVE_TTL", self.negative_ttl
+        )
+        self.refresh_interval = app.config.get(
+            "DEVICE_CACHE_REFRESH_INTERVAL", self.refresh_interval
+        )
+        self.max_unknown = app.config.get("DEVICE_CACHE_MAX_UNKNOWN", self.max_unknown)
+
+        with self._lock:
+            self._devices = {}
+            self._unknown = {}
+            self._warmed_at = None
+
+    def get(self, uid: str):
+        now = time.monotonic()
+        if self._warmed_at is None or now - self._warmed_at > self.refresh_interval:
+            self.warm()
+
+        device_id = self._devices.get(uid)
+        if device_id is not None:
+            self.hits += 1
+            return device_id
+
+        expires = self._unknown.get(uid)
+        if expires is not None and expires > now:
+            self.negative_hits += 1
+            return None
+
+        self.misses += 1
+        return self._load(uid)
+
+    def warm(self) -> None:
+        from app.models.device import DeviceModel
+
+        with self.app.app_context():
+            rows = DeviceModel.query.with_entities(DeviceModel.uid, DeviceModel.id)
+            devices = {uid: device_id for uid, device_id in rows}
+
+        with self._lock:
+            self.queries += 1
+            self._devices = devices
+            self._unknown = {}
+            self._warmed_at = time.monotonic()
+
+    def add(self, uid: str, device_id: int) -> None:
+        with self._lock:
+            self._devices[uid] = device_id
+            self._unknown.pop(uid, None)
+
+    def discard(self, uid: str) -> None:
+        with self._lock:
+            self._devices.pop(uid, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "devices": len(self._devices),
+            "unknown": len(self._unknown),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "queries": self.queries,
+            "hit_rate": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+        }
+
+    def _load(self, uid: str):
+        from app.models.device import DeviceModel
+
+        with self.app.app_context():
+            device = DeviceModel.find_by_uid(uid)
+            device_id = device.id if device else None
+
+        with self._lock:
+            self.queries += 1
+            if device_id is not None:
+                self._devices[uid] = device_id
+                return device_id
+
+            if len(self._unknown) >= self.max_unknown:
+                self._evict_unknown()
+            self._unknown[uid] = time.monotonic() + self.negative_ttl
+
+        return None
+
+    def _evict_unknown(self) -> None:
+        now = time.monotonic()
+        self._unknown = {
+            uid: expires for uid, expires in self._unknown.items() if expires > now
+        }
+        while len(self._unknown) >= self.max_unknown:
+            del self._unknown[next(iter(self._unknown))]
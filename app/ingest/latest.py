@@ -0,0 +1,174 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import Flask
+from influxdb_client import InfluxDBClient
+
+from app.influx.query import MEASUREMENT
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS latest (
+    uid TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value,
+    time INTEGER NOT NULL,
+    PRIMARY KEY (uid, field)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS latest_seeded (seeded INTEGER);
+"""
+
+UPSERT = """
+INSERT INTO latest (uid, field, value, time) VALUES (?, ?, ?, ?)
+ON CONFLICT (uid, field) DO UPDATE SET value = excluded.value, time = excluded.time
+WHERE excluded.time > latest.time
+"""
+
+
+class LatestStore:
+    """Last value and timestamp of every field of every device.
+
+    The ingest path calls ``update`` for each message, and the latest
+    endpoints read from here instead of querying InfluxDB. Values are kept
+    in process memory, or in the SQLite file at ``LATEST_STORE_PATH`` so
+    that separate ingest and web processes see the same values. A cold
+    store (a new process, or a new SQLite file) seeds itself with one
+    ``last()`` query over ``LATEST_SEED_RANGE`` on first read. Seeded values
+    never replace newer ones, so seeding after ingest has started is
+    harmless.
+    """
+
+    def __init__(self, client: InfluxDBClient, app: Flask = None) -> None:
+        self.client = client
+        self.bucket = None
+        self.path = None
+        self.seed_range = "-30d"
+        self.seed_retry_interval = 60
+
+        self._values = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._seeded = False
+        self._seed_attempt = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self.bucket = app.config["INFLUXDB_BUCKET"]
+        self.path = app.config.get("LATEST_STORE_PATH")
+        self.seed_range = app.config.get("LATEST_SEED_RANGE", self.seed_range)
+
+        with self._lock:
+            self._values = {}
+            self._local = threading.local()
+            self._seeded = False
+            self._seed_attempt = None
+
+    def update(self, uid: str, timestamp: int, fields: dict) -> None:
+        """Stores the fields of a reading taken at ``timestamp`` nanoseconds."""
+        if self.path:
+            with self._connection() as connection:
+                connection.executemany(
+                    UPSERT,
+                    [(uid, field, value, timestamp) for field, value in fields.items()],
+                )
+            return
+
+        with self._lock:
+            latest = self._values.setdefault(uid, {})
+            for field, value in fields.items():
+                current = latest.get(field)
+                if current is None or current[1] < timestamp:
+                    latest[field] = (value, timestamp)
+
+    def get_many(self, uids: list) -> dict:
+        """Returns {uid: {field: {"value", "timestamp"}}} for the given uids."""
+        if not uids:
+            return {}
+
+        self._ensure_seeded()
+
+        if self.path:
+            placeholders = ", ".join("?" * len(uids))
+            rows = self._connection().execute(
+                "SELECT uid, field, value, time FROM latest "
+                f"WHERE uid IN ({placeholders})",
+                uids,
+            )
+        else:
+            # update writes to the dicts from the ingest threads
+            with self._lock:
+                rows = [
+                    (uid, field, value, timestamp)
+                    for uid in uids
+                    for field, (value, timestamp) in self._values.get(uid, {}).items()
+                ]
+
+        latest = {uid: {} for uid in uids}
+        for uid, field, value, timestamp in rows:
+            latest[uid][field] = {
+                "value": value,
+                "timestamp": datetime.fromtimestamp(
+                    timestamp / 1e9, timezone.utc
+                ).isoformat(),
+            }
+        return latest
+
+    def seed(self) -> None:
+        query = (
+            f'from(bucket: "{self.bucket}") '
+            f"|> range(start: {self.seed_range}) "
+            f'|> filter(fn: (r) => r._measurement == "{MEASUREMENT}") '
+            f"|> last()"
+        )
+        tables = self.client.query_api().query(query)
+
+        for table in tables:
+            for record in table.records:
+                timestamp = int(record.get_time().timestamp() * 1e9)
+                self.update(
+                    record.values["device"],
+                    timestamp,
+                    {record.get_field(): record.get_value()},
+                )
+
+    def _ensure_seeded(self) -> None:
+        if self._seeded:
+            return
+
+        now = time.monotonic()
+        if (
+            self._seed_attempt is not None
+            and now - self._seed_attempt < self.seed_retry_interval
+        ):
+            return
+        self._seed_attempt = now
+
+        if not self.path or not self._seeded_on_disk():
+            try:
+                self.seed()
+            except Exception as e:
+                print(f"Failed to seed latest readings: {e}")
+                return
+
+            if self.path:
+                with self._connection() as connection:
+                    connection.execute("INSERT INTO latest_seeded VALUES (1)")
+
+        self._seeded = True
+
+    def _seeded_on_disk(self) -> bool:
+        row = self._connection().execute("SELECT 1 FROM latest_seeded LIMIT 1")
+        return row.fetchone() is not None
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+        return connection
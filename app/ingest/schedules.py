@@ -0,0 +1,182 @@
+import heapq
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import Flask
+
+from app.ingest.commands import CommandDispatcher
+from app.scheduler import Scheduler
+
+RELOAD_OVERLAP = timedelta(seconds=60)
+
+
+class ScheduleEngine:
+    """Fires heat schedules through the command dispatcher.
+
+    The engine keeps one min-heap of (next fire time, schedule id) and a
+    single entry in the shared ``Scheduler`` for the earliest of them, so
+    nothing polls for due schedules. All schedules due at the same time are
+    loaded and sent in batches of ``SCHEDULES_BATCH_SIZE``, each batch being
+    one query for the schedules, one for their devices and one commit of
+    all their commands.
+
+    Schedules created or changed through the API are picked up every
+    ``SCHEDULES_RELOAD_INTERVAL`` seconds with a query on ``updated_at``;
+    changes that land in between are caught when the schedule is loaded
+    to be fired, and deleted schedules are dropped then.
+    """
+
+    def __init__(
+        self, scheduler: Scheduler, dispatcher: CommandDispatcher, app: Flask = None
+    ) -> None:
+        self.scheduler = scheduler
+        self.dispatcher = dispatcher
+        self.reload_interval = 30
+        self.batch_size = 500
+
+        self._heap = []
+        self._versions = {}
+        self._loaded_at = None
+        self._started = False
+
+        self.fired = 0
+        self.commands = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self.reload_interval = app.config.get(
+            "SCHEDULES_RELOAD_INTERVAL", self.reload_interval
+        )
+        self.batch_size = app.config.get("SCHEDULES_BATCH_SIZE", self.batch_size)
+
+    def start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+        self.scheduler.call_later(0, self.reload, key="schedules-reload")
+
+    def stats(self) -> dict:
+        return {
+            "schedules": len(self._versions),
+            "heap": len(self._heap),
+            "fired": self.fired,
+            "commands": self.commands,
+        }
+
+    def reload(self) -> None:
+        """Loads the schedules changed since the last reload."""
+        from app import db
+        from app.models.command import utcnow
+        from app.models.schedule import ScheduleModel
+
+        now = utcnow()
+        query = db.session.query(
+            ScheduleModel.id,
+            ScheduleModel.time,
+            ScheduleModel.days,
+            ScheduleModel.timezone,
+            ScheduleModel.enabled,
+            ScheduleModel.updated_at,
+        )
+        if self._loaded_at is not None:
+            query = query.filter(
+                ScheduleModel.updated_at >= self._loaded_at - RELOAD_OVERLAP
+            )
+
+        after = now.replace(tzinfo=timezone.utc)
+        for schedule in query:
+            if self._versions.get(schedule.id) != schedule.updated_at:
+                self._push(schedule, after)
+
+        self._loaded_at = now
+        self._arm()
+        if self._started:
+            self.scheduler.call_later(
+                self.reload_interval, self.reload, key="schedules-reload"
+            )
+
+    def fire(self) -> None:
+        """Sends the commands of every schedule that is due."""
+        now = time.time()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            when, schedule_id, version = heapq.heappop(self._heap)
+            if self._versions.get(schedule_id) == version:
+                due.append((when, schedule_id))
+
+        for start in range(0, len(due), self.batch_size):
+            self._dispatch(due[start : start + self.batch_size])
+
+        self._arm()
+
+    def _dispatch(self, due: list) -> None:
+        from app import db
+        from app.models.command import CommandModel
+        from app.models.device import DeviceModel
+        from app.models.schedule import ScheduleModel
+
+        schedules = ScheduleModel.query.filter(
+            ScheduleModel.id.in_([schedule_id for _, schedule_id in due])
+        ).all()
+        schedules = {schedule.id: schedule for schedule in schedules}
+
+        rooms = {}
+        devices = {}
+        for when, schedule_id in due:
+            schedule = schedules.get(schedule_id)
+            if schedule is None:
+                del self._versions[schedule_id]
+                continue
+
+            fire = datetime.fromtimestamp(when, timezone.utc)
+            changed = schedule.updated_at != self._versions[schedule_id]
+            self._push(schedule, fire)
+            if not schedule.enabled:
+                continue
+            # a schedule changed since it was loaded fires only if still due
+            if changed and schedule.next_fire(fire - timedelta(microseconds=1)) != fire:
+                continue
+
+            self.fired += 1
+            if schedule.device_id is not None:
+                devices[schedule.device_id] = schedule.temperature
+            else:
+                rooms[schedule.room_id] = schedule.temperature
+
+        if not rooms and not devices:
+            return
+
+        rows = db.session.query(
+            DeviceModel.id, DeviceModel.uid, DeviceModel.room_id
+        ).filter(db.or_(DeviceModel.id.in_(devices), DeviceModel.room_id.in_(rooms)))
+
+        commands = []
+        uids = []
+        for device_id, uid, room_id in rows:
+            # a device schedule wins over one for its room
+            temperature = devices.get(device_id, rooms.get(room_id))
+            commands.append(CommandModel(device_id=device_id, temperature=temperature))
+            uids.append(uid)
+
+        if commands:
+            self.dispatcher.send(commands, uids)
+            self.commands += len(commands)
+
+    def _push(self, schedule, after: datetime) -> None:
+        from app.models.schedule import next_fire
+
+        self._versions[schedule.id] = schedule.updated_at
+        if not schedule.enabled:
+            return
+
+        fire = next_fire(schedule.time, schedule.days, schedule.timezone, after)
+        if fire is not None:
+            heapq.heappush(
+                self._heap, (fire.timestamp(), schedule.id, schedule.updated_at)
+            )
+
+    def _arm(self) -> None:
+        if self._heap:
+            self.scheduler.call_at(self._heap[0][0], self.fire, key="schedules")
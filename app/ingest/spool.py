@@ -0,0 +1,177 @@
+import fcntl
+import os
+import threading
+import time
+
+SEGMENT_SUFFIX = ".lp"
+
+
+class Spool:
+    """Append-only on-disk queue of line protocol records.
+
+    Records are appended to numbered segment files inside a slot directory.
+    A segment is closed once it grows past ``segment_bytes`` or when the
+    drainer asks for it, and is only deleted after it has been delivered.
+    Each process locks its own slot, so several ingest consumers can share
+    the same spool directory and a restarted process picks up what its
+    predecessor left behind.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 4 * 1024 * 1024,
+        max_bytes: int = 512 * 1024 * 1024,
+        max_age: float = 7 * 24 * 60 * 60,
+    ) -> None:
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self.records_spooled = 0
+        self.records_evicted = 0
+        self.segments_evicted = 0
+
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self.directory = self._acquire_slot(directory)
+
+        self._segments = sorted(
+            int(name[: -len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+        self._current = None
+        self._current_size = 0
+
+    def append(self, records: list) -> None:
+        data = "".join(f"{record}\n" for record in records).encode()
+
+        with self._lock:
+            if self._current is None:
+                self._open_segment()
+
+            self._current.write(data)
+            self._current.flush()
+            self._current_size += len(data)
+            self.records_spooled += len(records)
+
+            if self._current_size >= self.segment_bytes:
+                self._close_segment()
+
+    def pending(self) -> bool:
+        return bool(self._segments)
+
+    def oldest(self):
+        """Returns the sequence number and records of the oldest segment."""
+        with self._lock:
+            if not self._segments:
+                return None, []
+
+            seq = self._segments[0]
+            if self._current is not None and seq == self._current_seq:
+                self._close_segment()
+
+        with open(self._path(seq), "rb") as f:
+            data = f.read()
+
+        # a crash can leave a half-written record at the end of a segment
+        if not data.endswith(b"\n"):
+            data = data[: data.rfind(b"\n") + 1]
+
+        return seq, data.decode().splitlines()
+
+    def remove(self, seq: int) -> None:
+        with self._lock:
+            if seq in self._segments:
+                self._segments.remove(seq)
+            self._unlink(seq)
+
+    def evict(self) -> None:
+        """Drops the oldest segments until the spool fits its size and age limits."""
+        with self._lock:
+            closed = [seq for seq in self._segments if seq != self._current_seq]
+            sizes = {seq: os.path.getsize(self._path(seq)) for seq in closed}
+            total = sum(sizes.values()) + self._current_size
+            cutoff = time.time() - self.max_age
+
+            for seq in closed:
+                too_big = total > self.max_bytes
+                too_old = os.path.getmtime(self._path(seq)) < cutoff
+                if not too_big and not too_old:
+                    break
+
+                with open(self._path(seq), "rb") as f:
+                    self.records_evicted += f.read().count(b"\n")
+                self.segments_evicted += 1
+                total -= sizes[seq]
+                self._segments.remove(seq)
+                self._unlink(seq)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._current is not None:
+                self._close_segment()
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    def stats(self) -> dict:
+        return {
+            "directory": self.directory,
+            "segments": len(self._segments),
+            "bytes": self._size(),
+            "records_spooled": self.records_spooled,
+            "records_evicted": self.records_evicted,
+            "segments_evicted": self.segments_evicted,
+        }
+
+    @property
+    def _current_seq(self):
+        return self._segments[-1] if self._current is not None else None
+
+    def _acquire_slot(self, directory: str) -> str:
+        slot = 0
+        while True:
+            path = os.path.join(directory, f"slot-{slot}")
+            os.makedirs(path, exist_ok=True)
+
+            lock_file = open(os.path.join(path, "lock"), "w")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                slot += 1
+                continue
+
+            self._lock_file = lock_file
+            return path
+
+    def _open_segment(self) -> None:
+        seq = self._segments[-1] + 1 if self._segments else 0
+        self._current = open(self._path(seq), "ab")
+        self._current_size = 0
+        self._segments.append(seq)
+
+    def _close_segment(self) -> None:
+        self._current.close()
+        self._current = None
+        self._current_size = 0
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:012d}{SEGMENT_SUFFIX}")
+
+    def _size(self) -> int:
+        size = 0
+        for seq in list(self._segments):
+            try:
+                size += os.path.getsize(self._path(seq))
+            except FileNotFoundError:
+                pass
+        return size
+
+    def _unlink(self, seq: int) -> None:
+        try:
+            os.remove(self._path(seq))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,112 @@
+import queue
+import threading
+import time
+from typing import Callable
+
+from flask import Flask
+
+
+class WorkerPool:
+    """Processes ingest tasks on a fixed set of worker threads.
+
+    Every worker owns a bounded queue and tasks are routed by hashing their
+    key, so tasks with the same key (the device uid) are processed one at a
+    time and in the order they were submitted. ``submit`` runs on the MQTT
+    network thread, so it never waits: a task for a full queue is dropped
+    and counted. With ``INGEST_WORKERS = 0`` tasks run inline.
+    """
+
+    def __init__(self, app: Flask = None) -> None:
+        self.app = None
+        self.workers = 4
+        self.queue_size = 1000
+
+        self._handler = None
+        self._queues = []
+        self._threads = []
+        self._busy = []
+        self._processed = []
+        self._lock = threading.Lock()
+        self._started_at = None
+
+        self.dropped = 0
+        self.errors = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self.app = app
+        self.workers = app.config.get("INGEST_WORKERS", self.workers)
+        self.queue_size = app.config.get("INGEST_WORKER_QUEUE_SIZE", self.queue_size)
+
+    def on_task(self) -> Callable:
+        def decorator(handler: Callable) -> Callable:
+            self._handler = handler
+            return handler
+
+        return decorator
+
+    def submit(self, key: str, *args) -> None:
+        if not self.workers:
+            self._process(args)
+            return
+
+        if not self._threads:
+            self._start()
+
+        try:
+            self._queues[hash(key) % self.workers].put_nowait(args)
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        busy = sum(self._busy)
+        return {
+            "workers": self.workers,
+            "queue_depths": [q.qsize() for q in self._queues],
+            "queue_size": self.queue_size,
+            "processed": sum(self._processed),
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "utilisation": busy / (elapsed * self.workers) if elapsed else 0.0,
+        }
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+
+            self._queues = [queue.Queue(self.queue_size) for _ in range(self.workers)]
+            self._busy = [0.0] * self.workers
+            self._processed = [0] * self.workers
+            self._started_at = time.monotonic()
+
+            for index in range(self.workers):
+                thread = threading.Thread(
+                    target=self._run,
+                    args=(index,),
+                    name=f"ingest-worker-{index}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self, index: int) -> None:
+        tasks = self._queues[index]
+
+        with self.app.app_context():
+            while True:
+                args = tasks.get()
+                started = time.monotonic()
+                self._process(args)
+                self._busy[index] += time.monotonic() - started
+                self._processed[index] += 1
+
+    def _process(self, args: tuple) -> None:
+        try:
+            self._handler(*args)
+        except Exception as e:
+            self.errors += 1
+            print(f"Failed to process ingest task: {e}")
@@ -0,0 +1,299 @@
+import atexit
+import threading
+import time
+from collections import deque
+
+from flask import Flask
+from influxdb_client import InfluxDBClient, Point
+from influxdb_client.client.write_api import SYNCHRONOUS
+from influxdb_client.rest import ApiException
+
+from app.ingest.spool import Spool
+
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+SPILL = "spill"
+BACKPRESSURE_POLICIES = (BLOCK, DROP_OLDEST, SPILL)
+
+
+def retryable(error: Exception) -> bool:
+    """Tells whether a failed write may succeed if it is sent again.
+
+    InfluxDB rejects some batches for good, e.g. with 422 for a field type
+    conflict or a point outside the retention period. Only connection
+    errors, 429 and 5xx responses are worth retrying.
+    """
+    if isinstance(error, ApiException) and error.status is not None:
+        return error.status == 429 or error.status >= 500
+    return True
+
+
+class PointWriter:
+    """Long-lived InfluxDB writer that buffers points and flushes them in batches.
+
+    Points are converted to line protocol as they are queued into a bounded
+    buffer. A single background thread flushes the buffer whenever
+    it holds ``INGEST_BATCH_SIZE`` points or ``INGEST_FLUSH_INTERVAL``
+    seconds have passed, whichever comes first. When the buffer is full the
+    ``INGEST_BACKPRESSURE`` policy decides whether the caller blocks, the
+    oldest buffered point is dropped or the overflow is spilled to disk.
+
+    With ``INGEST_SPOOL_DIR`` set, batches that InfluxDB rejects are written
+    to an on-disk spool instead of being dropped, and so is everything after
+    them until the spool has been replayed. A second thread replays the
+    spool in order with ``INGEST_SPOOL_BATCH_SIZE`` points per write.
+    Points carry their arrival time, so replaying a segment twice after a
+    partial failure only overwrites the same points. Batches InfluxDB
+    rejects for good are dropped and counted in ``points_rejected``
+    rather than spooled.
+    """
+
+    def __init__(self, client: InfluxDBClient, app: Flask = None) -> None:
+        self.client = client
+        self.bucket = None
+        self.org = None
+        self.batch_size = 500
+        self.flush_interval = 1.0
+        self.buffer_size = 10000
+        self.backpressure = DROP_OLDEST
+        self.spool_dir = None
+        self.spool_options = {}
+        self.spool_batch_size = 5000
+        self.spool_retry_interval = 5.0
+        self.spool = None
+
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._thread = None
+        self._drainer = None
+        self._closing = False
+        self._spilled = threading.Event()
+        self._write_api = None
+
+        self.points_written = 0
+        self.points_dropped = 0
+        self.points_spilled = 0
+        self.points_replayed = 0
+        self.points_rejected = 0
+        self.flush_errors = 0
+        self.last_batch_size = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self.bucket = app.config["INFLUXDB_BUCKET"]
+        self.org = app.config["INFLUXDB_ORG"]
+        self.batch_size = app.config.get("INGEST_BATCH_SIZE", self.batch_size)
+        self.flush_interval = app.config.get(
+            "INGEST_FLUSH_INTERVAL", self.flush_interval
+        )
+        self.buffer_size = app.config.get("INGEST_BUFFER_SIZE", self.buffer_size)
+        self.backpressure = app.config.get("INGEST_BACKPRESSURE", self.backpressure)
+        self.spool_dir = app.config.get("INGEST_SPOOL_DIR")
+        self.spool_options = {
+            "segment_bytes": app.config.get("INGEST_SPOOL_SEGMENT_BYTES"),
+            "max_bytes": app.config.get("INGEST_SPOOL_MAX_BYTES"),
+            "max_age": app.config.get("INGEST_SPOOL_MAX_AGE"),
+        }
+        self.spool_batch_size = app.config.get(
+            "INGEST_SPOOL_BATCH_SIZE", self.spool_batch_size
+        )
+        self.spool_retry_interval = app.config.get(
+            "INGEST_SPOOL_RETRY_INTERVAL", self.spool_retry_interval
+        )
+
+        if self.backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy '{self.backpressure}'")
+        if self.backpressure == SPILL and not self.spool_dir:
+            raise ValueError("The spill backpressure policy needs INGEST_SPOOL_DIR")
+
+    def write(self, *points) -> None:
+        records = [
+            point.to_line_protocol() if isinstance(point, Point) else point
+            for point in points
+        ]
+
+        overflow = []
+
+        with self._lock:
+            self._ensure_started()
+
+            for record in records:
+                if len(self._buffer) >= self.buffer_size:
+                    if self.backpressure == BLOCK:
+                        while len(self._buffer) >= self.buffer_size:
+                            self._not_full.wait()
+                    elif self.backpressure == SPILL:
+                        overflow.append(record)
+                        continue
+                    else:
+                        self._buffer.popleft()
+                        self.points_dropped += 1
+
+                self._buffer.append(record)
+
+            if len(self._buffer) >= self.batch_size:
+                self._not_empty.notify()
+
+        if overflow:
+            self._spill(overflow)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closing = True
+            self._not_empty.notify()
+            thread = self._thread
+
+        self._spilled.set()
+        if thread is not None:
+            thread.join()
+        if self._drainer is not None:
+            self._drainer.join()
+        if self.spool is not None:
+            self.spool.close()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": len(self._buffer),
+            "buffer_size": self.buffer_size,
+            "backpressure": self.backpressure,
+            "points_written": self.points_written,
+            "points_dropped": self.points_dropped,
+            "points_spilled": self.points_spilled,
+            "points_replayed": self.points_replayed,
+            "points_rejected": self.points_rejected,
+            "flush_errors": self.flush_errors,
+            "last_batch_size": self.last_batch_size,
+            "last_flush_latency": self.last_flush_latency,
+            "max_flush_latency": self.max_flush_latency,
+            "spool": self.spool.stats() if self.spool else None,
+        }
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+
+        self._write_api = self.client.write_api(write_options=SYNCHRONOUS)
+
+        if self.spool_dir:
+            options = {k: v for k, v in self.spool_options.items() if v is not None}
+            self.spool = Spool(self.spool_dir, **options)
+            self._drainer = threading.Thread(
+                target=self._drain, name="influx-spool-drainer", daemon=True
+            )
+            self._drainer.start()
+
+        self._thread = threading.Thread(
+            target=self._run, name="influx-writer", daemon=True
+        )
+        self._thread.start()
+
+        atexit.register(self.close)
+
+    def _take_batch(self) -> list:
+        count = min(len(self._buffer), self.batch_size)
+        batch = [self._buffer.popleft() for _ in range(count)]
+        if batch:
+            self._not_full.notify_all()
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._buffer) < self.batch_size and not self._closing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._not_empty.wait(remaining)
+
+                batch = self._take_batch()
+                done = self._closing and not self._buffer
+
+            if batch:
+                self._write_batch(batch)
+            if done:
+                return
+
+    def _write_batch(self, batch: list) -> None:
+        # keep points in order while older ones are still waiting on disk
+        if self.spool is not None and self.spool.pending():
+            self._spill(batch)
+            return
+
+        started = time.monotonic()
+        try:
+            self._write_api.write(bucket=self.bucket, org=self.org, record=batch)
+        except Exception as e:
+            self.flush_errors += 1
+            print(f"Failed to write {len(batch)} points to InfluxDB: {e}")
+            if not retryable(e):
+                self.points_rejected += len(batch)
+            elif self.spool is not None:
+                self._spill(batch)
+            else:
+                self.points_dropped += len(batch)
+            return
+        finally:
+            latency = time.monotonic() - started
+            self.last_batch_size = len(batch)
+            self.last_flush_latency = latency
+            self.max_flush_latency = max(self.max_flush_latency, latency)
+
+        self.points_written += len(batch)
+
+    def _spill(self, records: list) -> None:
+        if self.spool is None:
+            self.points_dropped += len(records)
+            return
+
+        self.spool.append(records)
+        self.points_spilled += len(records)
+        self._spilled.set()
+
+    def _drain(self) -> None:
+        while not self._closing:
+            self.spool.evict()
+
+            seq, records = self.spool.oldest()
+            if seq is None:
+                self._spilled.wait(self.spool_retry_interval)
+                self._spilled.clear()
+                continue
+
+            try:
+                replayed = self._replay(records)
+            except Exception as e:
+                self.flush_errors += 1
+                print(f"Failed to replay spooled points to InfluxDB: {e}")
+                time.sleep(self.spool_retry_interval)
+                continue
+
+            self.spool.remove(seq)
+            self.points_replayed += replayed
+
+    def _replay(self, records: list) -> int:
+        """Writes a segment and returns how many of its points were accepted.
+
+        Chunks rejected for good are dropped so that they cannot hold up the
+        spool, any other error is raised to retry the whole segment.
+        """
+        replayed = 0
+        for i in range(0, len(records), self.spool_batch_size):
+            chunk = records[i : i + self.spool_batch_size]
+            try:
+                self._write_api.write(bucket=self.bucket, org=self.org, record=chunk)
+            except Exception as e:
+                if retryable(e):
+                    raise
+                self.flush_errors += 1
+                self.points_rejected += len(chunk)
+                print(f"InfluxDB rejected {len(chunk)} spooled points: {e}")
+                continue
+            replayed += len(chunk)
+        return replayed
@@ -0,0 +1,68 @@
+from datetime import datetime, timezone
+
+from .base import BaseModel
+from app import db
+
+PENDING = "pending"
+ACKNOWLEDGED = "acknowledged"
+FAILED = "failed"
+# replaced by a newer command for the same device before it was acknowledged
+SUPERSEDED = "superseded"
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class CommandModel(BaseModel):
+    __tablename__ = "commands"
+    __table_args__ = (
+        db.Index("ix_commands_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(
+        db.Integer, db.ForeignKey("devices.id"), nullable=False, index=True
+    )
+    temperature = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(16), nullable=False, default=PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+    next_attempt_at = db.Column(db.DateTime)
+    acknowledged_at = db.Column(db.DateTime)
+
+    @classmethod
+    def find_by_id_for_user(cls, command_id: int, user_id: int) -> "CommandModel":
+        from app.models.device import DeviceModel
+        from app.models.room import RoomModel
+
+        return (
+            cls.query.join(DeviceModel, DeviceModel.id == cls.device_id)
+            .join(RoomModel, RoomModel.id == DeviceModel.room_id)
+            .filter(cls.id == command_id, RoomModel.user_id == user_id)
+            .first()
+        )
+
+    @classmethod
+    def find_due(cls, now: datetime, limit: int):
+        """Returns (command, device uid) for pending commands due for a resend."""
+        from app.models.device import DeviceModel
+
+        return (
+            db.session.query(cls, DeviceModel.uid)
+            .join(DeviceModel, DeviceModel.id == cls.device_id)
+            .filter(cls.status == PENDING, cls.next_attempt_at <= now)
+            .order_by(cls.next_attempt_at)
+            .limit(limit)
+            .all()
+        )
+
+    @classmethod
+    def supersede(cls, device_ids: list) -> None:
+        """Marks the pending commands of the devices superseded, uncommitted."""
+        db.session.query(cls).filter(
+            cls.device_id.in_(device_ids), cls.status == PENDING
+        ).update({"status": SUPERSEDED}, synchronize_session=False)
+
+    def payload(self) -> dict:
+        return {"id": self.id, "set_temperature": str(self.temperature)}
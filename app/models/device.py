@@ -1,7 +1,6 @@
-import json
-
 from .base import BaseModel
-from app import db, mqtt
+from .command import CommandModel
+from app import db, device_cache, command_dispatcher
 
 
 class DeviceModel(BaseModel):
@@ -14,7 +13,26 @@ class DeviceModel(BaseModel):
     uid = db.Column(db.String(64), unique=True, nullable=False)
     name = db.Column(db.String(128), nullable=False)
     temperature = db.Column(db.Integer)
-    room_id = db.Column(db.Integer, db.ForeignKey("rooms.id"))
+    room_id = db.Column(db.Integer, db.ForeignKey("rooms.id"), index=True)
+
+    commands = db.relationship(
+        "CommandModel", backref="device", lazy=True, cascade="all, delete-orphan"
+    )
+
+    @classmethod
+    def find_by_id_for_user(cls, device_id: int, user_id: int) -> "DeviceModel":
+        """Returns the device if it is in a room owned by the user.
+
+        Uses a single query, the room is loaded with the device.
+        """
+        from app.models.room import RoomModel
+
+        return (
+            cls.query.join(RoomModel, RoomModel.id == cls.room_id)
+            .options(db.contains_eager(cls.room))
+            .filter(cls.id == device_id, RoomModel.user_id == user_id)
+            .first()
+        )
 
     @classmethod
     def find_by_uid(cls, uid: str) -> "DeviceModel":
@@ -28,8 +46,36 @@ class DeviceModel(BaseModel):
     def find_all_by_room_id(cls, room_id: int):
         return cls.query.filter_by(room_id=room_id).all()
 
-    def set_temperature(self, temperature):
-        data = {"set_temperature": str(temperature)}
-        mqtt.publish(f"command/{self.uid}", json.dumps(data))
-        self.temperature = temperature
-        self.save_to_db()
+    def save_to_db(self) -> None:
+        super().save_to_db()
+        device_cache.add(self.uid, self.id)
+
+    def delete_from_db(self) -> None:
+        super().delete_from_db()
+        device_cache.discard(self.uid)
+
+    @classmethod
+    def set_room_temperature(cls, room_id: int, temperature: int) -> list:
+        """Sends a temperature command to every device in a room.
+
+        Takes one query for the devices and one INSERT returning the ids
+        of the commands, which are published without waiting for each
+        other. Returns the commands, whose ids and payloads are read
+        without further queries.
+        """
+        devices = db.session.query(cls.id, cls.uid).filter_by(room_id=room_id).all()
+        commands = [
+            CommandModel(device_id=device.id, temperature=temperature)
+            for device in devices
+        ]
+        if commands:
+            command_dispatcher.send(commands, [device.uid for device in devices])
+        return commands
+
+    def set_temperature(self, temperature) -> int:
+        """Sends a temperature command and returns its id.
+
+        Rapid changes are coalesced into one command, and the setpoint is
+        stored once the device acknowledges it.
+        """
+        return command_dispatcher.send_coalesced(self.id, self.uid, temperature)
@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from .base import BaseModel
+from .command import utcnow
+from app import db
+
+
+class RevokedTokenModel(BaseModel):
+    """A logged out access token, kept until the token itself expires."""
+
+    __tablename__ = "revoked_tokens"
+
+    jti = db.Column(db.String(36), primary_key=True)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=utcnow, index=True)
+    expires_at = db.Column(db.DateTime, index=True)
+
+    @classmethod
+    def exists(cls, jti: str) -> bool:
+        return db.session.query(db.exists().where(cls.jti == jti)).scalar()
+
+    @classmethod
+    def find_jtis(cls, since: datetime = None) -> list:
+        """Returns the jtis of the unexpired tokens revoked since ``since``."""
+        now = utcnow()
+        query = db.session.query(cls.jti).filter(
+            db.or_(cls.expires_at.is_(None), cls.expires_at > now)
+        )
+        if since is not None:
+            query = query.filter(cls.revoked_at >= since)
+        return [jti for jti, in query]
+
+    @classmethod
+    def delete_expired(cls) -> int:
+        deleted = cls.query.filter(cls.expires_at <= utcnow()).delete()
+        db.session.commit()
+        return deleted
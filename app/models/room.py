@@ -10,10 +10,58 @@ class RoomModel(BaseModel):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(128), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("users.id"), nullable=False, index=True
+    )
 
     devices = db.relationship("DeviceModel", backref="room", lazy=True)
 
+    @classmethod
+    def find_by_id_for_user(cls, room_id: int, user_id: int) -> "RoomModel":
+        return cls.query.filter_by(id=room_id, user_id=user_id).first()
+
     @classmethod
     def find_by_name(cls, name: str) -> "RoomModel":
         return cls.query.filter_by(name=name).first()
+
+    @classmethod
+    def find_devices_for_user(cls, room_id: int, user_id: int):
+        """Returns (device id, name, uid) rows for a room owned by the user.
+
+        Uses a single query. Returns None if the room does not exist or
+        belongs to someone else, and an empty list if it has no devices.
+        """
+        from app.models.device import DeviceModel
+
+        rows = (
+            db.session.query(DeviceModel.id, DeviceModel.name, DeviceModel.uid)
+            .select_from(cls)
+            .outerjoin(DeviceModel, DeviceModel.room_id == cls.id)
+            .filter(cls.id == room_id, cls.user_id == user_id)
+            .all()
+        )
+        if not rows:
+            return None
+        return [row for row in rows if row.id is not None]
+
+    @classmethod
+    def find_all_devices_for_user(cls, user_id: int):
+        """Returns (room id, room name, device id, name, uid) rows in one query.
+
+        Rooms without devices have None in the device columns.
+        """
+        from app.models.device import DeviceModel
+
+        return (
+            db.session.query(
+                cls.id.label("room_id"),
+                cls.name.label("room_name"),
+                DeviceModel.id,
+                DeviceModel.name,
+                DeviceModel.uid,
+            )
+            .outerjoin(DeviceModel, DeviceModel.room_id == cls.id)
+            .filter(cls.user_id == user_id)
+            .order_by(cls.id, DeviceModel.id)
+            .all()
+        )
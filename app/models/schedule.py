@@ -0,0 +1,85 @@
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from .base import BaseModel
+from .command import utcnow
+from app import db
+
+EVERY_DAY = 0b1111111
+
+
+class ScheduleModel(BaseModel):
+    """Sets the temperature of a room or a device at a time of day.
+
+    ``days`` is a bitmask of weekdays, bit 0 being Monday, and ``time`` is
+    local to ``timezone``.
+    """
+
+    __tablename__ = "schedules"
+
+    id = db.Column(db.Integer, primary_key=True)
+    room_id = db.Column(db.Integer, db.ForeignKey("rooms.id"), index=True)
+    device_id = db.Column(db.Integer, db.ForeignKey("devices.id"), index=True)
+    temperature = db.Column(db.Integer, nullable=False)
+    time = db.Column(db.Time, nullable=False)
+    days = db.Column(db.Integer, nullable=False, default=EVERY_DAY)
+    timezone = db.Column(db.String(64), nullable=False, default="UTC")
+    enabled = db.Column(db.Boolean, nullable=False, default=True)
+    updated_at = db.Column(
+        db.DateTime, nullable=False, default=utcnow, onupdate=utcnow, index=True
+    )
+
+    # deleting a room or a device deletes its schedules
+    room = db.relationship(
+        "RoomModel",
+        backref=db.backref("schedules", lazy=True, cascade="all, delete-orphan"),
+    )
+    device = db.relationship(
+        "DeviceModel",
+        backref=db.backref("schedules", lazy=True, cascade="all, delete-orphan"),
+    )
+
+    @classmethod
+    def find_all_for_user(cls, user_id: int):
+        return cls._for_user(user_id).order_by(cls.id).all()
+
+    @classmethod
+    def find_by_id_for_user(cls, schedule_id: int, user_id: int) -> "ScheduleModel":
+        return cls._for_user(user_id).filter(cls.id == schedule_id).first()
+
+    @classmethod
+    def _for_user(cls, user_id: int):
+        from app.models.device import DeviceModel
+        from app.models.room import RoomModel
+
+        return (
+            cls.query.outerjoin(DeviceModel, DeviceModel.id == cls.device_id)
+            .join(
+                RoomModel,
+                RoomModel.id == db.func.coalesce(cls.room_id, DeviceModel.room_id),
+            )
+            .filter(RoomModel.user_id == user_id)
+        )
+
+    def next_fire(self, after: datetime) -> datetime:
+        """Returns the first time after ``after`` (UTC) the schedule fires."""
+        return next_fire(self.time, self.days, self.timezone, after)
+
+
+def next_fire(at: time, days: int, zone: str, after: datetime):
+    """Returns the first UTC time after ``after`` at ``at`` on one of ``days``.
+
+    ``at`` is local to ``zone``. Returns None when no day is set.
+    """
+    zone = ZoneInfo(zone)
+    local = after.astimezone(zone)
+    for offset in range(8):
+        day = local.date() + timedelta(days=offset)
+        if not days & (1 << day.weekday()):
+            continue
+
+        fire = datetime.combine(day, at, tzinfo=zone).astimezone(timezone.utc)
+        if fire > after:
+            return fire
+
+    return None
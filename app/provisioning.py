@@ -0,0 +1,90 @@
+import csv
+import os
+import uuid
+from datetime import datetime, timezone
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+
+
+class TpmEncryptor:
+    """Encrypts secrets with the TPM key at ``persistent_handle``.
+
+    The ESAPI context and the key handle are opened once and reused for
+    every secret, which is what makes provisioning in bulk fast compared to
+    running ``tpm2_rsaencrypt`` per secret.
+    """
+
+    def __init__(self, persistent_handle: int) -> None:
+        from tpm2_pytss import ESAPI
+
+        self.tpm = ESAPI()
+        self.key_handle = self.tpm.tr_from_tpmpublic(persistent_handle)
+
+    def encrypt(self, data: bytes) -> bytes:
+        from tpm2_pytss import TPM2B_PUBLIC_KEY_RSA, TPMT_RSA_DECRYPT
+        from tpm2_pytss.constants import TPM2_ALG
+
+        return bytes(
+            self.tpm.rsa_encrypt(
+                self.key_handle,
+                TPM2B_PUBLIC_KEY_RSA(data),
+                TPMT_RSA_DECRYPT(_cdata=TPM2_ALG.RSAES),
+            )
+        )
+
+    def close(self) -> None:
+        self.tpm.close()
+
+
+class SoftwareEncryptor:
+    """Encrypts secrets with an RSA public key read from a PEM file.
+
+    The blobs are RSAES-PKCS1-v1_5 like the ones from the TPM, so the
+    public half of the TPM key (``tpm2_readpublic -f pem``) provisions
+    secrets the TPM can decrypt without the TPM being present.
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            self.key = serialization.load_pem_public_key(f.read())
+
+    def encrypt(self, data: bytes) -> bytes:
+        return self.key.encrypt(data, padding.PKCS1v15())
+
+    def close(self) -> None:
+        pass
+
+
+def provision(count: int, output: str, encryptor, mapping: str = None) -> list:
+    """Creates ``count`` device secrets and returns their serials.
+
+    Each secret is encrypted into ``<output>/<serial>.enc2``, the serial
+    being the time of the run and an index, so the file names say nothing
+    about the secrets. All of the secrets are inserted into the uids table
+    in one transaction. ``mapping`` is an optional CSV file of serial and
+    uid pairs, to be kept apart from the encrypted files.
+    """
+    from app import db
+    from app.models.uid import UidModel
+
+    os.makedirs(output, exist_ok=True)
+
+    run = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    uids = {f"{run}-{index:06d}": str(uuid.uuid4()) for index in range(1, count + 1)}
+    for serial, uid in uids.items():
+        # exclusive create, a second run within the same second fails here
+        with open(os.path.join(output, f"{serial}.enc2"), "xb") as f:
+            f.write(encryptor.encrypt(uid.encode()))
+
+    if mapping:
+        fd = os.open(mapping, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["serial", "uid"])
+            writer.writerows(uids.items())
+
+    db.session.execute(db.insert(UidModel), [{"uid": uid} for uid in uids.values()])
+    db.session.commit()
+
+    return list(uids)
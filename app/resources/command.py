@@ -0,0 +1,20 @@
+from flask_restx import Resource
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from app.models.command import CommandModel
+from app.schemas.command import CommandSchema
+
+COMMAND_NOT_FOUND = "Command not found."
+
+command_schema = CommandSchema()
+
+
+class Command(Resource):
+    @classmethod
+    @jwt_required()
+    def get(cls, command_id: int):
+        command = CommandModel.find_by_id_for_user(command_id, get_jwt_identity())
+        if not command:
+            return {"message": COMMAND_NOT_FOUND}, 404
+
+        return command_schema.dump(command), 200
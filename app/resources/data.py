@@ -1,20 +1,259 @@
-from flask import request
+import base64
+import json
+from datetime import datetime, timezone
+
+from flask import request, current_app, Response, stream_with_context
 from flask_restx import Resource, reqparse, Api
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from influxdb_client.client.query_api import QueryApi
 
 from app.models.device import DeviceModel
+from app.models.room import RoomModel
 from app.schemas.data import DataSchema
-from app import influx_db
+from app.schemas.fast import FastSchema
+from app.influx.query import (
+    FIELDS,
+    AGGREGATES,
+    parse_duration,
+    parse_time,
+    choose_window,
+    build_query,
+)
+from app.influx.rollups import choose_rollup
+from app import influx_db, query_cache
 
 DEVICE_NOT_FOUND = "Device not found."
+ROOM_NOT_FOUND = "Room not found."
+INVALID_DATA_TYPE = "Invalid data type provided"
+INVALID_RANGE = "Invalid start_date or end_date provided."
+INVALID_RESOLUTION = "Invalid resolution provided."
+INVALID_MAX_POINTS = "max_points must be a positive integer."
+INVALID_AGGREGATE = "Invalid aggregate provided."
+INVALID_FORMAT = "Invalid format provided."
+INVALID_PAGE_SIZE = "page_size must be a positive integer."
+INVALID_CURSOR = "Invalid cursor provided."
+
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+STREAM_CHUNK_ROWS = 500
+
+DEFAULT_START = "-1d"
+DEFAULT_STOP = "now()"
 
 data_schema = DataSchema()
 data_schema_list = DataSchema(many=True)
+# dumps the values of Flux records without building a dict per point
+record_schema_list = FastSchema(
+    data_schema_list,
+    dicts=True,
+    attributes={"timestamp": "_time", "value": "_value", "field": "_field"},
+)
 
 api = Api()
 
 
+def parse_data_args(args) -> dict:
+    """Validates the range and resolution arguments shared by the data endpoints.
+
+    Raises ValueError with a message for the client when an argument is invalid.
+    """
+    now = datetime.now(timezone.utc)
+    try:
+        start = parse_time(args.get("start_date", DEFAULT_START), now)
+        stop = parse_time(args.get("end_date", DEFAULT_STOP), now)
+    except ValueError:
+        raise ValueError(INVALID_RANGE)
+    if start >= stop:
+        raise ValueError(INVALID_RANGE)
+
+    data_type = args.get("data_type")
+    if data_type and data_type not in FIELDS:
+        raise ValueError(INVALID_DATA_TYPE)
+
+    resolution = args.get("resolution")
+    if resolution:
+        try:
+            resolution = parse_duration(resolution)
+        except ValueError:
+            raise ValueError(INVALID_RESOLUTION)
+
+    budget = current_app.config.get("DATA_MAX_POINTS")
+    max_points = args.get("max_points")
+    if max_points:
+        try:
+            max_points = int(max_points)
+        except ValueError:
+            raise ValueError(INVALID_MAX_POINTS)
+        if max_points <= 0:
+            raise ValueError(INVALID_MAX_POINTS)
+        max_points = min(max_points, budget)
+    elif resolution:
+        max_points = budget
+
+    aggregate = args.get("aggregate", "mean")
+    if aggregate not in AGGREGATES:
+        raise ValueError(INVALID_AGGREGATE)
+
+    window = choose_window(start, stop, resolution, max_points)
+    rollup, window, rollup_stop = choose_rollup(
+        current_app.config, start, stop, window, aggregate, exact=window == resolution
+    )
+
+    return {
+        "bucket": current_app.config.get("INFLUXDB_BUCKET"),
+        "rollup": rollup,
+        "rollup_stop": rollup_stop,
+        "start": start,
+        "stop": stop,
+        "field": data_type,
+        "window": window,
+        "aggregate": aggregate,
+    }
+
+
+def cache_range(args: dict, request_args) -> tuple:
+    """Returns the (start, stop, ttl) a data query is cached under.
+
+    Ranges relative to now are aligned to cache buckets so that polls made
+    a few seconds apart share an entry, absolute ranges are used as given.
+    Only the key is aligned: the query reads the requested range and
+    cached rows are trimmed with ``within`` before they are returned.
+    """
+    relative = all(
+        value == "now()" or value.startswith("-")
+        for value in (
+            request_args.get("start_date", DEFAULT_START),
+            request_args.get("end_date", DEFAULT_STOP),
+        )
+    )
+    if relative:
+        return query_cache.align(args["start"], args["stop"], args["window"])
+    return args["start"], args["stop"], query_cache.ttl(args["start"], args["stop"])
+
+
+def within(rows: list, start: datetime, stop: datetime) -> list:
+    """Drops the rows of a cached result that are outside [start, stop]."""
+    return [row for row in rows if start <= row["_time"] <= stop]
+
+
+def response_format(args, accept_mimetypes) -> str:
+    """Returns "json", "columnar", "ndjson" or "csv" for the request."""
+    output_format = args.get("format")
+    if output_format:
+        if output_format not in ("json", "columnar", *STREAM_FORMATS):
+            raise ValueError(INVALID_FORMAT)
+        return output_format
+
+    best = accept_mimetypes.best_match(["application/json", *STREAM_FORMATS.values()])
+    for output_format, mimetype in STREAM_FORMATS.items():
+        if best == mimetype:
+            return output_format
+    return "json"
+
+
+def parse_page_args(args) -> tuple:
+    """Returns (page_size, after) for the raw point pages of the data endpoint.
+
+    Raises ValueError with a message for the client when an argument is invalid.
+    """
+    page_size = args.get("page_size")
+    if page_size:
+        try:
+            page_size = int(page_size)
+        except ValueError:
+            raise ValueError(INVALID_PAGE_SIZE)
+        if page_size <= 0:
+            raise ValueError(INVALID_PAGE_SIZE)
+        page_size = min(page_size, current_app.config.get("DATA_MAX_PAGE_SIZE"))
+    else:
+        page_size = current_app.config.get("DATA_PAGE_SIZE")
+
+    after = None
+    cursor = args.get("cursor")
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise ValueError(INVALID_CURSOR)
+
+    return page_size, after
+
+
+def encode_cursor(time: datetime, field: str = "") -> str:
+    """Returns an opaque cursor for the point at ``time`` and ``field``."""
+    cursor = f"{time.isoformat()}|{field}"
+    return base64.urlsafe_b64encode(cursor.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        cursor = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(INVALID_CURSOR)
+
+    time, _, field = cursor.partition("|")
+    time = datetime.fromisoformat(time)
+    if time.tzinfo is None or (field and field not in FIELDS):
+        raise ValueError(INVALID_CURSOR)
+    return time, field
+
+
+def columnar(rows) -> dict:
+    """Turns pivoted rows into one epoch millisecond array plus one per field.
+
+    After the pivot a device has a single table in which every row carries
+    all queried fields, so the arrays stay aligned.
+    """
+    data = {"timestamp": []}
+    timestamps = data["timestamp"]
+
+    for values in rows:
+        timestamps.append(int(values["_time"].timestamp() * 1000))
+        for field in FIELDS:
+            if field in values:
+                data.setdefault(field, []).append(values[field])
+
+    return data
+
+
+def point(record) -> dict:
+    """Returns the time, value and field of a record, as cached."""
+    return {
+        "_time": record.get_time(),
+        "_value": record.get_value(),
+        "_field": record.get_field(),
+    }
+
+
+def stream_records(records, output_format: str):
+    """Yields the records as NDJSON or CSV in chunks of STREAM_CHUNK_ROWS rows."""
+    if output_format == "csv":
+        rows = ["timestamp,field,value\n"]
+    else:
+        rows = []
+
+    for record in records:
+        timestamp = record.get_time().isoformat()
+        if output_format == "csv":
+            rows.append(f"{timestamp},{record.get_field()},{record.get_value()}\n")
+        else:
+            row = {
+                "timestamp": timestamp,
+                "value": record.get_value(),
+                "field": record.get_field(),
+            }
+            rows.append(json.dumps(row) + "\n")
+
+        if len(rows) >= STREAM_CHUNK_ROWS:
+            yield "".join(rows)
+            rows = []
+
+    if rows:
+        yield "".join(rows)
+
+
 class Data(Resource):
     parser = reqparse.RequestParser()
     parser.add_argument("start_date", type=str, required=False, default="-1h")
@@ -25,45 +264,195 @@ class Data(Resource):
         required=False,
         choices=["temperature", "humidity", "light_level"],
     )
+    parser.add_argument(
+        "resolution",
+        type=str,
+        required=False,
+        help="Aggregation window such as 5m or 1h",
+    )
+    parser.add_argument(
+        "max_points",
+        type=int,
+        required=False,
+        help="Maximum number of points per field, picks the window automatically",
+    )
+    parser.add_argument(
+        "aggregate",
+        type=str,
+        required=False,
+        default="mean",
+        choices=["mean", "min", "max", "last"],
+    )
+    parser.add_argument(
+        "format",
+        type=str,
+        required=False,
+        choices=["json", "columnar", "ndjson", "csv"],
+        help="columnar returns one array per field, "
+        "ndjson and csv stream the whole range without a point limit",
+    )
+    parser.add_argument(
+        "page_size",
+        type=int,
+        required=False,
+        help="Number of raw points per page, the next page is requested with "
+        "the cursor from the X-Next-Cursor response header",
+    )
+    parser.add_argument(
+        "cursor",
+        type=str,
+        required=False,
+        help="X-Next-Cursor header of the previous page",
+    )
 
     @classmethod
     @api.expect(parser)
     @jwt_required()
     def get(cls, device_id: int):
-        device = DeviceModel.find_by_id(device_id)
-        if not device or device.room.user_id != get_jwt_identity():
+        device = DeviceModel.find_by_id_for_user(device_id, get_jwt_identity())
+        if not device:
             return {"message": DEVICE_NOT_FOUND}, 404
 
-        args = request.args
+        try:
+            args = parse_data_args(request.args)
+            output_format = response_format(request.args, request.accept_mimetypes)
+        except ValueError as e:
+            return {"message": str(e)}, 400
+
+        if output_format in STREAM_FORMATS:
+            query = build_query(uids=[device.uid], **args)
+            records = influx_db.query_api().query_stream(query)
+            return Response(
+                stream_with_context(stream_records(records, output_format)),
+                mimetype=STREAM_FORMATS[output_format],
+            )
 
-        start_date = args.get("start_date", "-1d")
-        end_date = args.get("end_date", "now()")
+        # raw points are paged, aggregated ones are bounded by max_points
+        page_size, after = None, None
+        if not args["window"]:
+            try:
+                page_size, after = parse_page_args(request.args)
+            except ValueError as e:
+                return {"message": str(e)}, 400
 
-        query = (
-            f'from(bucket: "mokki") '
-            f"|> range(start: {start_date}, stop: {end_date}) "
-            f'|> filter(fn: (r) => r.device == "{device.uid}") '
-            f"|> limit(n:100) "
+        key_start, key_stop, ttl = cache_range(args, request.args)
+        key = (
+            device.uid,
+            output_format,
+            page_size,
+            after,
+            *{**args, "start": key_start, "stop": key_stop}.values(),
         )
+        cached = query_cache.get(key)
+        if cached is None:
+            cached = cls.fetch(device.uid, args, output_format, page_size, after)
+            query_cache.set([device.uid], key, cached, key_stop, ttl)
+
+        rows, headers = cached
+        rows = within(rows, args["start"], args["stop"])
+        if output_format == "columnar":
+            return columnar(rows), 200, headers
+        return record_schema_list.dump(rows), 200, headers
 
-        data_type = args.get("data_type")
-        if data_type:
-            if data_type not in ["temperature", "humidity", "light_level"]:
-                return {"message": "Invalid data type provided"}, 400
-            query += f'|> filter(fn: (r) => r["_field"] == "{data_type}")'
+    @classmethod
+    def fetch(
+        cls, uid: str, args: dict, output_format: str, page_size: int, after: tuple
+    ) -> tuple:
+        """Returns the (rows, headers) of one device data query."""
+        query = build_query(
+            uids=[uid],
+            pivot=output_format == "columnar",
+            # one extra point tells whether there is a next page
+            page_size=page_size + 1 if page_size else None,
+            after=after,
+            **args,
+        )
 
         query_api = influx_db.query_api()
         tables = query_api.query(query)
 
-        data = []
-        for table in tables:
-            for record in table.records:
-                data.append(
-                    {
-                        "timestamp": record.get_time(),
-                        "value": record.get_value(),
-                        "field": record.get_field(),
-                    }
-                )
-
-        return data_schema_list.dump(data), 200
+        headers = {}
+        records = [record for table in tables for record in table.records]
+        if page_size and len(records) > page_size:
+            records = records[:page_size]
+            last = records[-1]
+            field = "" if output_format == "columnar" else last.get_field()
+            headers["X-Next-Cursor"] = encode_cursor(last.get_time(), field)
+
+        if output_format == "columnar":
+            rows = [
+                {
+                    "_time": record.values["_time"],
+                    **{
+                        field: record.values[field]
+                        for field in FIELDS
+                        if field in record.values
+                    },
+                }
+                for record in records
+            ]
+        else:
+            rows = [point(record) for record in records]
+
+        return rows, headers
+
+
+class RoomData(Resource):
+    parser = Data.parser.copy()
+    parser.remove_argument("format")
+    parser.remove_argument("page_size")
+    parser.remove_argument("cursor")
+
+    @classmethod
+    @api.expect(parser)
+    @jwt_required()
+    def get(cls, room_id: int):
+        devices = RoomModel.find_devices_for_user(room_id, get_jwt_identity())
+        if devices is None:
+            return {"message": ROOM_NOT_FOUND}, 404
+
+        try:
+            args = parse_data_args(request.args)
+        except ValueError as e:
+            return {"message": str(e)}, 400
+
+        if not devices:
+            return [], 200
+
+        # raw points are capped per device and field
+        limit = None if args["window"] else 100
+
+        uids = sorted(device.uid for device in devices)
+        key_start, key_stop, ttl = cache_range(args, request.args)
+        key = (
+            "room",
+            room_id,
+            tuple(uids),
+            limit,
+            *{**args, "start": key_start, "stop": key_stop}.values(),
+        )
+        points = query_cache.get(key)
+        if points is None:
+            query = build_query(uids=uids, limit=limit, **args)
+
+            query_api = influx_db.query_api()
+            tables = query_api.query(query)
+
+            points = {uid: [] for uid in uids}
+            for table in tables:
+                for record in table.records:
+                    points[record.values["device"]].append(point(record))
+            query_cache.set(uids, key, points, key_stop, ttl)
+
+        data = [
+            {
+                "device_id": device.id,
+                "name": device.name,
+                "data": record_schema_list.dump(
+                    within(points[device.uid], args["start"], args["stop"])
+                ),
+            }
+            for device in devices
+        ]
+
+        return data, 200
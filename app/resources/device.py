@@ -13,6 +13,7 @@ from tpm2_pytss.constants import TPM2_ALG
 from app.models.device import DeviceModel
 from app.models.room import RoomModel
 from app.models.uid import UidModel
+from app.resources.listing import list_parser, list_schema, paginate, parse_list_args
 from app.schemas.device import DeviceSchema
 
 UNIQUE_ID_ALREADY_EXISTS = "A device with unique ID '{}' already exists."
@@ -25,12 +26,11 @@ ERROR_PAIRING_DEVICE = "Error pairing device via bluetooth."
 NAME_WAS_NOT_PROVIDED = "Name was not provided."
 TEMPERATURE_WAS_NOT_PROVIDED = "Temperature was not provided."
 TEMPERATURE_BETWEEN = "Temperature must be set between 0 and 40."
-TEMPERATURES_SET_IN_ROOM = "Temperatures set to {} in room '{}'."
+TEMPERATURES_SENT_TO_ROOM = "Temperature {} sent to the devices in room '{}'."
 DEVICES_NOT_FOUND = "Devices not found."
-DEVICE_TEMPERATURE_SET = "Device '{}' temperature set to {}."
+DEVICE_TEMPERATURE_SENT = "Temperature {} sent to device '{}'."
 
 device_schema = DeviceSchema()
-device_list_schema = DeviceSchema(many=True)
 
 api = Api()
 
@@ -39,8 +39,8 @@ class Device(Resource):
     @classmethod
     @jwt_required()
     def get(cls, device_id: int):
-        device = DeviceModel.find_by_id(device_id)
-        if not device or device.room.user_id != get_jwt_identity():
+        device = DeviceModel.find_by_id_for_user(device_id, get_jwt_identity())
+        if not device:
             return {"message": DEVICE_NOT_FOUND}, 404
 
         return device_schema.dump(device), 200
@@ -48,8 +48,8 @@ class Device(Resource):
     @classmethod
     @jwt_required()
     def delete(cls, device_id: int):
-        device = DeviceModel.find_by_id(device_id)
-        if not device or device.room.user_id != get_jwt_identity():
+        device = DeviceModel.find_by_id_for_user(device_id, get_jwt_identity())
+        if not device:
             return {"message": DEVICE_NOT_FOUND}, 404
 
         device.delete_from_db()
@@ -59,16 +59,16 @@ class Device(Resource):
     @classmethod
     @jwt_required()
     def patch(cls, device_id: int):
-        device = DeviceModel.find_by_id(device_id)
-        if not device or device.room.user_id != get_jwt_identity():
+        device = DeviceModel.find_by_id_for_user(device_id, get_jwt_identity())
+        if not device:
             return {"message": DEVICE_NOT_FOUND}, 404
 
         device_json = request.get_json()
 
         room_id = device_json.get("room_id")
         if room_id:
-            room = RoomModel.find_by_id(room_id)
-            if room and room.user_id == get_jwt_identity():
+            room = RoomModel.find_by_id_for_user(room_id, get_jwt_identity())
+            if room:
                 device.room_id = room.id
 
         device.name = device_json.get("name", device.name)
@@ -83,8 +83,8 @@ class Device(Resource):
     @classmethod
     @jwt_required()
     def post(cls, device_id: int):
-        device = DeviceModel.find_by_id(device_id)
-        if not device or device.room.user_id != get_jwt_identity():
+        device = DeviceModel.find_by_id_for_user(device_id, get_jwt_identity())
+        if not device:
             return {"message": DEVICE_NOT_FOUND}, 404
 
         device_json = request.get_json()
@@ -98,29 +98,40 @@ class Device(Resource):
         if min_temperature >= temperature >= max_temperature:
             return {"message": TEMPERATURE_BETWEEN}, 400
 
-        device.set_temperature(temperature)
+        command_id = device.set_temperature(temperature)
 
-        return {"message": DEVICE_TEMPERATURE_SET.format(device.name, temperature)}
+        return {
+            "message": DEVICE_TEMPERATURE_SENT.format(temperature, device.name),
+            "command_id": command_id,
+        }, 202
 
 
 class DeviceList(Resource):
     @classmethod
+    @api.expect(list_parser)
     @jwt_required()
     def get(cls, room_id: int):
-        room = RoomModel.find_by_id(room_id)
+        room = RoomModel.find_by_id_for_user(room_id, get_jwt_identity())
 
-        if not room or room.user_id != get_jwt_identity():
+        if not room:
             return {"message": ROOM_NOT_FOUND_OR_NO_ACCESS}, 404
 
-        devices = DeviceModel.find_all_by_room_id(room_id)
-        return device_list_schema.dump(devices), 200
+        try:
+            limit, after, fields = parse_list_args(request.args)
+            schema = list_schema(DeviceSchema, fields)
+        except ValueError as e:
+            return {"message": str(e)}, 400
+
+        query = DeviceModel.query.filter_by(room_id=room_id)
+        devices, headers = paginate(query, DeviceModel, limit, after)
+        return schema.dump(devices), 200, headers
 
     @classmethod
     @jwt_required()
     def post(cls, room_id: int):
-        room = RoomModel.find_by_id(room_id)
+        room = RoomModel.find_by_id_for_user(room_id, get_jwt_identity())
 
-        if not room or room.user_id != get_jwt_identity():
+        if not room:
             return {"message": ROOM_NOT_FOUND_OR_NO_ACCESS}, 404
 
         device_json = request.get_json()
@@ -134,14 +145,16 @@ class DeviceList(Resource):
         if min_temperature >= temperature >= max_temperature:
             return {"message": TEMPERATURE_BETWEEN}, 400
 
-        devices = DeviceModel.find_all_by_room_id(room_id)
-        if not devices:
+        # read before the commit expires the room
+        message = TEMPERATURES_SENT_TO_ROOM.format(temperature, room.name)
+        commands = DeviceModel.set_room_temperature(room_id, temperature)
+        if not commands:
             return {"message": DEVICES_NOT_FOUND}, 400
 
-        for device in devices:
-            device.set_temperature(temperature)
-
-        return {"message": TEMPERATURES_SET_IN_ROOM.format(temperature, room.name)}
+        return {
+            "message": message,
+            "command_ids": [command.id for command in commands],
+        }, 202
 
 
 async def handle_response(sender, data, data_queue):
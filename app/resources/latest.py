@@ -0,0 +1,57 @@
+from flask_restx import Resource
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from app.models.device import DeviceModel
+from app.models.room import RoomModel
+from app import latest_store
+
+DEVICE_NOT_FOUND = "Device not found."
+ROOM_NOT_FOUND = "Room not found."
+
+
+class DeviceLatest(Resource):
+    @classmethod
+    @jwt_required()
+    def get(cls, device_id: int):
+        device = DeviceModel.find_by_id_for_user(device_id, get_jwt_identity())
+        if not device:
+            return {"message": DEVICE_NOT_FOUND}, 404
+
+        return latest_store.get_many([device.uid])[device.uid], 200
+
+
+class RoomLatest(Resource):
+    @classmethod
+    @jwt_required()
+    def get(cls, room_id: int):
+        devices = RoomModel.find_devices_for_user(room_id, get_jwt_identity())
+        if devices is None:
+            return {"message": ROOM_NOT_FOUND}, 404
+
+        latest = latest_store.get_many([device.uid for device in devices])
+
+        return [
+            {"device_id": device.id, "name": device.name, "latest": latest[device.uid]}
+            for device in devices
+        ], 200
+
+
+class Latest(Resource):
+    @classmethod
+    @jwt_required()
+    def get(cls):
+        rows = RoomModel.find_all_devices_for_user(get_jwt_identity())
+        latest = latest_store.get_many([row.uid for row in rows if row.uid])
+
+        rooms = {}
+        for row in rows:
+            room = rooms.setdefault(
+                row.room_id,
+                {"room_id": row.room_id, "name": row.room_name, "devices": []},
+            )
+            if row.id is not None:
+                room["devices"].append(
+                    {"device_id": row.id, "name": row.name, "latest": latest[row.uid]}
+                )
+
+        return list(rooms.values()), 200
@@ -0,0 +1,107 @@
+import base64
+from functools import lru_cache
+
+from flask import current_app
+from flask_restx import reqparse
+from marshmallow import fields as ma_fields
+
+from app.schemas.fast import FastSchema
+
+INVALID_LIMIT = "limit must be a positive integer."
+INVALID_CURSOR = "Invalid cursor provided."
+INVALID_FIELDS = "Invalid fields requested: {}."
+
+list_parser = reqparse.RequestParser()
+list_parser.add_argument(
+    "limit",
+    type=int,
+    required=False,
+    help="Number of items per page, the next page is requested with "
+    "the cursor from the X-Next-Cursor response header",
+)
+list_parser.add_argument(
+    "cursor",
+    type=str,
+    required=False,
+    help="X-Next-Cursor header of the previous page",
+)
+list_parser.add_argument(
+    "fields",
+    type=str,
+    required=False,
+    help="Comma separated fields to return, e.g. id,name",
+)
+
+
+def parse_list_args(args) -> tuple:
+    """Returns (limit, after, fields) for the list endpoints.
+
+    ``after`` is the id the page starts after and ``fields`` a tuple of
+    field names or None for all of them. Raises ValueError with a message
+    for the client when an argument is invalid.
+    """
+    limit = args.get("limit")
+    if limit:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError(INVALID_LIMIT)
+        if limit <= 0:
+            raise ValueError(INVALID_LIMIT)
+        limit = min(limit, current_app.config.get("LIST_MAX_PAGE_SIZE"))
+    else:
+        limit = current_app.config.get("LIST_PAGE_SIZE")
+
+    after = None
+    cursor = args.get("cursor")
+    if cursor:
+        after = decode_id_cursor(cursor)
+
+    fields = args.get("fields")
+    if fields:
+        fields = tuple(sorted({field.strip() for field in fields.split(",")} - {""}))
+    return limit, after, fields or None
+
+
+def encode_id_cursor(item_id: int) -> str:
+    """Returns an opaque cursor for the page after ``item_id``."""
+    return base64.urlsafe_b64encode(str(item_id).encode()).decode().rstrip("=")
+
+
+def decode_id_cursor(cursor: str) -> int:
+    try:
+        cursor = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return int(cursor.decode())
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(INVALID_CURSOR)
+
+
+@lru_cache(maxsize=256)
+def list_schema(schema_class, fields: tuple = None):
+    """Returns a shared compiled ``many`` schema dumping only ``fields``.
+
+    Nested fields are selected with dots, e.g. ``devices.name``. Raises
+    ValueError with a message for the client when a field does not exist.
+    """
+    try:
+        schema = schema_class(many=True, only=fields)
+        # nested schemas check their fields only when first used
+        for field in schema.fields.values():
+            if isinstance(field, ma_fields.Nested):
+                field.schema
+    except ValueError:
+        raise ValueError(INVALID_FIELDS.format(",".join(fields)))
+    return FastSchema(schema)
+
+
+def paginate(query, model, limit: int, after: int = None) -> tuple:
+    """Returns (items, headers) for one page of ``query`` in id order."""
+    if after is not None:
+        query = query.filter(model.id > after)
+    items = query.order_by(model.id).limit(limit + 1).all()
+
+    headers = {}
+    if len(items) > limit:
+        items = items[:limit]
+        headers["X-Next-Cursor"] = encode_id_cursor(items[-1].id)
+    return items, headers
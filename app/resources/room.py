@@ -1,26 +1,30 @@
 from flask import request
-from flask_restx import Resource
+from flask_restx import Resource, Api
 from flask_jwt_extended import jwt_required, create_access_token, get_jwt_identity
 
+from app import db
 from app.models.room import RoomModel
-from app.schemas.room import RoomSchema
+from app.resources.listing import list_parser, list_schema, paginate, parse_list_args
+from app.schemas.room import RoomSchema, RoomTreeSchema
 
 NAME_ALREADY_EXISTS = "A room with name '{}' already exists."
 ERROR_INSERTING = "An error occured while inserting the room."
 ROOM_NOT_FOUND = "Room not found."
 ROOM_DELETED = "Room deleted."
 NAME_WAS_NOT_PROVIDED = "Name was not provided."
+INVALID_INCLUDE = "include must be devices."
 
 room_schema = RoomSchema()
-room_list_schema = RoomSchema(many=True)
+
+api = Api()
 
 
 class Room(Resource):
     @classmethod
     @jwt_required()
     def get(cls, room_id: int):
-        room = RoomModel.find_by_id(room_id)
-        if not room or room.user_id != get_jwt_identity():
+        room = RoomModel.find_by_id_for_user(room_id, get_jwt_identity())
+        if not room:
             return {"message": ROOM_NOT_FOUND}, 404
 
         return room_schema.dump(room), 200
@@ -28,8 +32,8 @@ class Room(Resource):
     @classmethod
     @jwt_required()
     def delete(cls, room_id: int):
-        room = RoomModel.find_by_id(room_id)
-        if not room or room.user_id != get_jwt_identity():
+        room = RoomModel.find_by_id_for_user(room_id, get_jwt_identity())
+        if not room:
             return {"message": ROOM_NOT_FOUND}, 404
 
         room.delete_from_db()
@@ -39,8 +43,8 @@ class Room(Resource):
     @classmethod
     @jwt_required()
     def patch(cls, room_id: int):
-        room = RoomModel.find_by_id(room_id)
-        if not room or room.user_id != get_jwt_identity():
+        room = RoomModel.find_by_id_for_user(room_id, get_jwt_identity())
+        if not room:
             return {"message": ROOM_NOT_FOUND}, 404
 
         room_json = request.get_json()
@@ -59,12 +63,42 @@ class Room(Resource):
 
 
 class RoomList(Resource):
+    parser = list_parser.copy()
+    parser.add_argument(
+        "include",
+        type=str,
+        required=False,
+        choices=["devices"],
+        help="devices returns every room with its devices",
+    )
+
     @classmethod
+    @api.expect(parser)
     @jwt_required()
     def get(cls):
-        user_id = get_jwt_identity()
-        rooms = RoomModel.query.filter_by(user_id=user_id).all()
-        return room_list_schema.dump(rooms), 200
+        include = request.args.get("include")
+        if include not in (None, "devices"):
+            return {"message": INVALID_INCLUDE}, 400
+
+        try:
+            limit, after, fields = parse_list_args(request.args)
+            if (
+                include
+                and fields
+                and not any(field.partition(".")[0] == "devices" for field in fields)
+            ):
+                fields += ("devices",)
+            schema = list_schema(RoomTreeSchema if include else RoomSchema, fields)
+        except ValueError as e:
+            return {"message": str(e)}, 400
+
+        query = RoomModel.query.filter_by(user_id=get_jwt_identity())
+        if include:
+            # one more query for the devices of the whole page
+            query = query.options(db.selectinload(RoomModel.devices))
+
+        rooms, headers = paginate(query, RoomModel, limit, after)
+        return schema.dump(rooms), 200, headers
 
     @classmethod
     @jwt_required()
@@ -0,0 +1,125 @@
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from flask import request, current_app
+from flask_restx import Resource
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from marshmallow import ValidationError
+
+from app import db
+from app.models.device import DeviceModel
+from app.models.room import RoomModel
+from app.models.schedule import ScheduleModel
+from app.schemas.schedule import ScheduleSchema
+
+SCHEDULE_NOT_FOUND = "Schedule not found."
+SCHEDULE_DELETED = "Schedule deleted."
+ERROR_INSERTING = "An error occured while inserting the schedule."
+ONE_TARGET = "Either room_id or device_id must be provided."
+ROOM_NOT_FOUND_OR_NO_ACCESS = "Room not found or you don't have access to it."
+DEVICE_NOT_FOUND = "Device not found."
+TEMPERATURE_BETWEEN = "Temperature must be set between {} and {}."
+INVALID_TIMEZONE = "Invalid timezone provided."
+
+schedule_schema = ScheduleSchema()
+schedule_list_schema = ScheduleSchema(many=True)
+
+
+def validate_schedule(schedule: ScheduleModel, user_id: int):
+    """Returns an error message if the schedule can not be saved for the user."""
+    if (schedule.room_id is None) == (schedule.device_id is None):
+        return ONE_TARGET
+
+    if schedule.room_id is not None:
+        if not RoomModel.find_by_id_for_user(schedule.room_id, user_id):
+            return ROOM_NOT_FOUND_OR_NO_ACCESS
+    else:
+        if not DeviceModel.find_by_id_for_user(schedule.device_id, user_id):
+            return DEVICE_NOT_FOUND
+
+    min_temperature = current_app.config.get("MIN_TEMPERATURE")
+    max_temperature = current_app.config.get("MAX_TEMPERATURE")
+    if not min_temperature <= schedule.temperature <= max_temperature:
+        return TEMPERATURE_BETWEEN.format(min_temperature, max_temperature)
+
+    try:
+        ZoneInfo(schedule.timezone or "UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        return INVALID_TIMEZONE
+
+    return None
+
+
+class Schedule(Resource):
+    @classmethod
+    @jwt_required()
+    def get(cls, schedule_id: int):
+        schedule = ScheduleModel.find_by_id_for_user(schedule_id, get_jwt_identity())
+        if not schedule:
+            return {"message": SCHEDULE_NOT_FOUND}, 404
+
+        return schedule_schema.dump(schedule), 200
+
+    @classmethod
+    @jwt_required()
+    def delete(cls, schedule_id: int):
+        schedule = ScheduleModel.find_by_id_for_user(schedule_id, get_jwt_identity())
+        if not schedule:
+            return {"message": SCHEDULE_NOT_FOUND}, 404
+
+        schedule.delete_from_db()
+
+        return {"message": SCHEDULE_DELETED}, 200
+
+    @classmethod
+    @jwt_required()
+    def patch(cls, schedule_id: int):
+        schedule = ScheduleModel.find_by_id_for_user(schedule_id, get_jwt_identity())
+        if not schedule:
+            return {"message": SCHEDULE_NOT_FOUND}, 404
+
+        try:
+            schedule = schedule_schema.load(
+                request.get_json(), instance=schedule, partial=True
+            )
+        except ValidationError as e:
+            db.session.rollback()
+            return e.messages, 400
+
+        error = validate_schedule(schedule, get_jwt_identity())
+        if error:
+            db.session.rollback()
+            return {"message": error}, 400
+
+        try:
+            schedule.save_to_db()
+        except:
+            return {"message": ERROR_INSERTING}, 500
+
+        return schedule_schema.dump(schedule), 200
+
+
+class ScheduleList(Resource):
+    @classmethod
+    @jwt_required()
+    def get(cls):
+        schedules = ScheduleModel.find_all_for_user(get_jwt_identity())
+        return schedule_list_schema.dump(schedules), 200
+
+    @classmethod
+    @jwt_required()
+    def post(cls):
+        try:
+            schedule = schedule_schema.load(request.get_json())
+        except ValidationError as e:
+            return e.messages, 400
+
+        error = validate_schedule(schedule, get_jwt_identity())
+        if error:
+            return {"message": error}, 400
+
+        try:
+            schedule.save_to_db()
+        except:
+            return {"message": ERROR_INSERTING}, 400
+
+        return schedule_schema.dump(schedule), 201
@@ -0,0 +1,31 @@
+from flask_restx import Resource
+from flask_jwt_extended import jwt_required
+
+from app import (
+    point_writer,
+    device_cache,
+    worker_pool,
+    query_cache,
+    command_dispatcher,
+    scheduler,
+    schedule_engine,
+    token_blocklist,
+)
+
+
+class Stats(Resource):
+    @classmethod
+    @jwt_required()
+    def get(cls):
+        return {
+            "ingest": {
+                "workers": worker_pool.stats(),
+                "writer": point_writer.stats(),
+                "devices": device_cache.stats(),
+            },
+            "query_cache": query_cache.stats(),
+            "commands": command_dispatcher.stats(),
+            "scheduler": scheduler.stats(),
+            "schedules": schedule_engine.stats(),
+            "revoked_tokens": token_blocklist.stats(),
+        }, 200
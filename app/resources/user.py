@@ -8,9 +8,9 @@ from flask_jwt_extended import (
 )
 from marshmallow import ValidationError
 
+from app import token_blocklist
 from app.models.user import UserModel
 from app.schemas.user import UserSchema
-from app.blocklist import BLOCKLIST
 
 USER_ALREADY_EXISTS = "A user with that username already exists."
 CREATED_SUCCESSFULLY = "User created successfully."
@@ -54,9 +54,9 @@ class UserLogout(Resource):
     @classmethod
     @jwt_required()
     def post(cls):
-        jti = get_jwt()["jti"]
+        jwt = get_jwt()
         user_id = get_jwt_identity()
-        BLOCKLIST.add(jti)
+        token_blocklist.revoke(jwt["jti"], jwt.get("exp"))
 
         return {"message": USER_LOGGED_OUT.format(user_id)}, 200
 
@@ -0,0 +1,121 @@
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, Hashable
+
+from flask import Flask
+
+
+class Scheduler:
+    """Runs callbacks at given times on a single background thread.
+
+    Entries are kept in a min-heap ordered by due time, so the thread only
+    ever waits for the earliest one however many are scheduled. An entry
+    scheduled under a ``key`` replaces the entry waiting under the same
+    key; replaced and cancelled entries stay in the heap and are skipped
+    when they come up. Callbacks run inside the application context and
+    should return quickly, as they delay every entry behind them.
+    """
+
+    def __init__(self, app: Flask = None) -> None:
+        self.app = None
+
+        self._heap = []
+        self._keys = {}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+        self.executed = 0
+        self.replaced = 0
+        self.errors = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self.app = app
+
+    def call_at(
+        self, when: float, callback: Callable, *args, key: Hashable = None
+    ) -> None:
+        """Runs ``callback(*args)`` at ``when``, a ``time.time()`` timestamp."""
+        entry = [when, next(self._counter), key, callback, args]
+
+        with self._condition:
+            if key is not None:
+                if key in self._keys:
+                    self.replaced += 1
+                self._keys[key] = entry
+            heapq.heappush(self._heap, entry)
+            self._condition.notify()
+
+        if self._thread is None:
+            self._start()
+
+    def call_later(
+        self, delay: float, callback: Callable, *args, key: Hashable = None
+    ) -> None:
+        self.call_at(time.time() + delay, callback, *args, key=key)
+
+    def cancel(self, key: Hashable) -> None:
+        with self._condition:
+            self._keys.pop(key, None)
+
+    def scheduled(self, key: Hashable) -> bool:
+        return key in self._keys
+
+    def stats(self) -> dict:
+        return {
+            "scheduled": len(self._heap),
+            "keys": len(self._keys),
+            "executed": self.executed,
+            "replaced": self.replaced,
+            "errors": self.errors,
+        }
+
+    def _start(self) -> None:
+        with self._condition:
+            if self._thread is not None:
+                return
+
+            self._thread = threading.Thread(
+                target=self._run, name="scheduler", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            *_, callback, args = self._next()
+            try:
+                with self.app.app_context():
+                    callback(*args)
+                self.executed += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"Failed to run scheduled task: {e}")
+
+    def _next(self) -> list:
+        """Waits for the earliest live entry to come due and pops it."""
+        with self._condition:
+            while True:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+
+                entry = self._heap[0]
+                key = entry[2]
+                if key is not None and self._keys.get(key) is not entry:
+                    heapq.heappop(self._heap)
+                    continue
+
+                delay = entry[0] - time.time()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+
+                heapq.heappop(self._heap)
+                if key is not None:
+                    del self._keys[key]
+                return entry
@@ -0,0 +1,8 @@
+from app import ma
+from app.models.command import CommandModel
+
+
+class CommandSchema(ma.SQLAlchemyAutoSchema):
+    class Meta:
+        model = CommandModel
+        include_fk = True
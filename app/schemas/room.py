@@ -1,5 +1,6 @@
 from app import ma
 from app.models.room import RoomModel
+from app.schemas.device import DeviceSchema
 
 
 class RoomSchema(ma.SQLAlchemyAutoSchema):
@@ -8,3 +9,7 @@ class RoomSchema(ma.SQLAlchemyAutoSchema):
         load_instance = True
         include_fk = True
         dump_only = ("id",)
+
+
+class RoomTreeSchema(RoomSchema):
+    devices = ma.Nested(DeviceSchema, many=True, dump_only=True)
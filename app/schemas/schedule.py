@@ -0,0 +1,14 @@
+from marshmallow import validate
+
+from app import ma
+from app.models.schedule import ScheduleModel, EVERY_DAY
+
+
+class ScheduleSchema(ma.SQLAlchemyAutoSchema):
+    class Meta:
+        model = ScheduleModel
+        load_instance = True
+        include_fk = True
+        dump_only = ("id", "updated_at")
+
+    days = ma.auto_field(validate=validate.Range(min=0, max=EVERY_DAY))
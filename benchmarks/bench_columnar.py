@@ -0,0 +1,81 @@
+"""Compares the row and columnar device data formats.
+
+Run from the project root with ``python -m benchmarks.bench_columnar``.
+"""
+import json
+import timeit
+from datetime import datetime, timedelta, timezone
+
+from influxdb_client.client.flux_table import FluxRecord, FluxTable
+
+from app.influx.query import FIELDS
+from app.resources.data import columnar, record_schema_list
+
+NUMBER = 5
+
+
+def row_tables(count: int) -> list:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    tables = []
+    for field in FIELDS:
+        table = FluxTable()
+        table.records = [
+            FluxRecord(
+                0,
+                {
+                    "_time": start + timedelta(seconds=10 * i),
+                    "_field": field,
+                    "_value": 20.0 + i % 7,
+                },
+            )
+            for i in range(count)
+        ]
+        tables.append(table)
+    return tables
+
+
+def pivoted_tables(count: int) -> list:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    table = FluxTable()
+    table.records = [
+        FluxRecord(
+            0,
+            {
+                "_time": start + timedelta(seconds=10 * i),
+                **{field: 20.0 + i % 7 for field in FIELDS},
+            },
+        )
+        for i in range(count)
+    ]
+    return [table]
+
+
+def rows(tables) -> str:
+    records = [record.values for table in tables for record in table.records]
+    return json.dumps(record_schema_list.dump(records))
+
+
+def columns(tables) -> str:
+    rows = [record.values for table in tables for record in table.records]
+    return json.dumps(columnar(rows))
+
+
+def main():
+    print(f"{'samples':>8} {'format':<9} {'bytes':>10} {'ms':>9} {'speedup':>8}")
+    for count in (100, 1000, 10000):
+        results = {
+            "rows": (rows, row_tables(count)),
+            "columnar": (columns, pivoted_tables(count)),
+        }
+
+        baseline = None
+        for name, (serialise, tables) in results.items():
+            size = len(serialise(tables))
+            seconds = timeit.timeit(lambda: serialise(tables), number=NUMBER)
+            ms = seconds / NUMBER * 1000
+            baseline = baseline or ms
+            print(f"{count:>8} {name:<9} {size:>10} {ms:>9.2f} {baseline / ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Compares decode cost and size of the JSON and packed sensor payloads.
+
+Run from the project root with ``python -m benchmarks.bench_payload``.
+"""
+import importlib.util
+import json
+import os
+import timeit
+
+# the codecs module is loaded from its file, importing it through the app
+# package would run app/__init__.py, which needs INFLUXDB_URL and a database
+CODECS = os.path.join(os.path.dirname(__file__), "..", "app", "ingest", "codecs.py")
+spec = importlib.util.spec_from_file_location("codecs_under_test", CODECS)
+codecs = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(codecs)
+decode_samples = codecs.decode_samples
+encode_packed = codecs.encode_packed
+
+NUMBER = 200_000
+
+
+def main():
+    reading = (21.5, 40.25, 5123)
+    payloads = {
+        "json": json.dumps(
+            {"temperature": 21.5, "humidity": 40.25, "light_level": 5123}
+        ).encode(),
+        "packed": encode_packed(*reading),
+    }
+
+    baseline = None
+    print(f"{'format':<8} {'bytes':>6} {'ns/decode':>10} {'speedup':>8}")
+    for name, payload in payloads.items():
+        seconds = timeit.timeit(lambda: decode_samples(payload), number=NUMBER)
+        ns = seconds / NUMBER * 1e9
+        baseline = baseline or ns
+        print(f"{name:<8} {len(payload):>6} {ns:>10.0f} {baseline / ns:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
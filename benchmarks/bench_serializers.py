@@ -0,0 +1,99 @@
+"""Compares marshmallow dumps with the compiled ``FastSchema`` dumps.
+
+Run from the project root with ``python -m benchmarks.bench_serializers``.
+Every case checks that both paths encode to the same JSON before timing.
+"""
+import json
+import timeit
+from datetime import datetime, timedelta, timezone
+
+from app.influx.query import FIELDS
+from app.models.device import DeviceModel
+from app.models.room import RoomModel
+from app.resources.data import data_schema_list, record_schema_list
+from app.schemas.device import DeviceSchema
+from app.schemas.fast import FastSchema
+from app.schemas.room import RoomTreeSchema
+
+COUNTS = (10, 1000, 100_000)
+
+
+def devices(count: int) -> list:
+    return [
+        DeviceModel(
+            id=i, uid=f"uid-{i}", name=f"device {i}", temperature=21, room_id=i // 4
+        )
+        for i in range(count)
+    ]
+
+
+def rooms(count: int) -> list:
+    # a room per four devices
+    result = []
+    for i in range(max(count // 4, 1)):
+        room = RoomModel(id=i, name=f"room {i}", user_id=1)
+        room.devices = devices(4)
+        result.append(room)
+    return result
+
+
+def records(count: int) -> list:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "_time": start + timedelta(seconds=10 * i),
+            "_field": FIELDS[i % len(FIELDS)],
+            "_value": 20.0 + i % 7,
+        }
+        for i in range(count)
+    ]
+
+
+def as_points(values: list) -> list:
+    # the dicts Data.get dumped through marshmallow
+    return [
+        {"timestamp": v["_time"], "value": v["_value"], "field": v["_field"]}
+        for v in values
+    ]
+
+
+def main():
+    device_schema = DeviceSchema(many=True)
+    room_schema = RoomTreeSchema(many=True)
+    cases = {
+        "devices": (
+            devices,
+            device_schema.dump,
+            FastSchema(device_schema).dump,
+        ),
+        "rooms": (
+            rooms,
+            room_schema.dump,
+            FastSchema(room_schema).dump,
+        ),
+        "data": (
+            records,
+            lambda values: data_schema_list.dump(as_points(values)),
+            record_schema_list.dump,
+        ),
+    }
+
+    print(
+        f"{'objects':>8} {'schema':<8} {'marshmallow ms':>15} {'fast ms':>9} {'speedup':>8}"
+    )
+    for count in COUNTS:
+        number = max(1, 10_000 // count)
+        for name, (make, slow, fast) in cases.items():
+            objects = make(count)
+            assert json.dumps(slow(objects)) == json.dumps(fast(objects)), name
+
+            slow_ms = timeit.timeit(lambda: slow(objects), number=number) / number
+            fast_ms = timeit.timeit(lambda: fast(objects), number=number) / number
+            print(
+                f"{count:>8} {name:<8} {slow_ms * 1000:>15.3f} {fast_ms * 1000:>9.3f} "
+                f"{slow_ms / fast_ms:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
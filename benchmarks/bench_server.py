@@ -0,0 +1,119 @@
+"""Measures API requests per second against gunicorn with 1, 2 and 4 workers.
+
+Run from the project root with ``python -m benchmarks.bench_server``. The
+server uses a temporary SQLite database and every request is an
+authenticated, database-backed ``GET /devices/<id>``.
+"""
+import http.client
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+DURATION = 10
+CLIENTS = 32
+PORT = 5099
+WORKERS = (1, 2, 4)
+
+
+def seed() -> tuple:
+    from flask_jwt_extended import create_access_token
+
+    from app import create_app, db
+    from app.models.device import DeviceModel
+    from app.models.room import RoomModel
+    from app.models.user import UserModel
+
+    app = create_app("development", mqtt_enabled=False)
+    with app.app_context():
+        db.create_all()
+        user = UserModel(username="bench", password="bench")
+        user.save_to_db()
+        room = RoomModel(name="bench", user_id=user.id)
+        room.save_to_db()
+        device = DeviceModel(uid="bench", name="bench", room_id=room.id)
+        device.save_to_db()
+        return device.id, create_access_token(identity=user.id)
+
+
+def start_server(workers: int, env: dict) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-c",
+            "gunicorn.conf.py",
+            "--workers",
+            str(workers),
+            "--bind",
+            f"127.0.0.1:{PORT}",
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", PORT, timeout=1)
+            connection.request("GET", "/swagger.json")
+            connection.getresponse().read()
+            return server
+        except OSError:
+            time.sleep(0.2)
+
+    server.kill()
+    raise RuntimeError("gunicorn did not start")
+
+
+def load(path: str, token: str) -> float:
+    stop = time.monotonic() + DURATION
+    counts = [0] * CLIENTS
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def client(index: int) -> None:
+        connection = http.client.HTTPConnection("127.0.0.1", PORT, timeout=10)
+        while time.monotonic() < stop:
+            connection.request("GET", path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status == 200:
+                counts[index] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(CLIENTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return sum(counts) / DURATION
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    os.environ["DEV_DATABASE_URL"] = f"sqlite:///{directory}/bench.db"
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-secret-key-that-is-long-enough")
+    os.environ["FLASK_CONFIG"] = "development"
+
+    device_id, token = seed()
+
+    print(f"{'workers':>7} {'req/s':>9} {'speedup':>8}")
+    baseline = None
+    for workers in WORKERS:
+        server = start_server(workers, dict(os.environ))
+        try:
+            rate = load(f"/devices/{device_id}", token)
+        finally:
+            server.terminate()
+            server.wait()
+
+        baseline = baseline or rate
+        print(f"{workers:>7} {rate:>9.0f} {rate / baseline:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,7 +12,19 @@ class Config:
     JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY")
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(days=365)
 
+    # revoked tokens, read from the database by every worker
+    REVOKED_TOKENS_CAPACITY = 100000
+    REVOKED_TOKENS_FALSE_POSITIVE_RATE = 0.01
+    REVOKED_TOKENS_CACHE_SIZE = 10000
+    REVOKED_TOKENS_SYNC_INTERVAL = 5
+    REVOKED_TOKENS_REBUILD_INTERVAL = 3600
+
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # engine options are picked per backend in create_app
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+    DB_POOL_RECYCLE = 1800
+    SQLITE_BUSY_TIMEOUT = 30
 
     MQTT_BROKER_URL = os.environ.get("MQTT_BROKER_URL")
     MQTT_BROKER_PORT = 8883
@@ -22,6 +34,77 @@ class Config:
     MQTT_TLS_CA_CERTS = os.environ.get("MQTT_TLS_CA_CERTS")
     MQTT_TLS_ENABLED = True
     MQTT_TLS_VERSION = ssl.PROTOCOL_TLS_CLIENT
+    # without a broker connection commands are published by the ingest
+    # consumers within COMMAND_RETRY_POLL_INTERVAL
+    MQTT_ENABLED = os.environ.get("MQTT_ENABLED", "true").lower() == "true"
+    # web workers only publish commands when ingest runs in ingest.py
+    MQTT_INGEST = os.environ.get("MQTT_INGEST", "true").lower() == "true"
+    MQTT_SHARED_GROUP = os.environ.get("MQTT_SHARED_GROUP", "ingest")
+
+    INGEST_PROCESSES = int(os.environ.get("INGEST_PROCESSES", 1))
+    INGEST_STATS_INTERVAL = 60
+
+    INFLUXDB_BUCKET = os.environ.get("INFLUXDB_BUCKET", "mokki")
+    INFLUXDB_ORG = os.environ.get("INFLUXDB_ORG", "sensec")
+    # downsampled copies of the raw bucket, managed with "flask rollups"
+    INFLUXDB_ROLLUPS_ENABLED = (
+        os.environ.get("INFLUXDB_ROLLUPS_ENABLED", "false").lower() == "true"
+    )
+    INFLUXDB_ROLLUPS = [
+        {"every": "1m", "retention": "30d"},
+        {"every": "1h", "retention": "730d"},
+        {"every": "1d", "retention": None},
+    ]
+
+    INGEST_BATCH_SIZE = 500
+    INGEST_FLUSH_INTERVAL = 1.0
+    INGEST_BUFFER_SIZE = 10000
+    INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", 4))
+    INGEST_WORKER_QUEUE_SIZE = 1000
+    INGEST_MAX_CLOCK_SKEW = 300
+    INGEST_BACKPRESSURE = os.environ.get("INGEST_BACKPRESSURE", "drop_oldest")
+    INGEST_SPOOL_DIR = os.environ.get("INGEST_SPOOL_DIR")
+    INGEST_SPOOL_SEGMENT_BYTES = 4 * 1024 * 1024
+    INGEST_SPOOL_MAX_BYTES = 512 * 1024 * 1024
+    INGEST_SPOOL_MAX_AGE = timedelta(days=7).total_seconds()
+    INGEST_SPOOL_BATCH_SIZE = 5000
+    INGEST_SPOOL_RETRY_INTERVAL = 5.0
+
+    DEVICE_CACHE_NEGATIVE_TTL = 60
+    DEVICE_CACHE_REFRESH_INTERVAL = 300
+    DEVICE_CACHE_MAX_UNKNOWN = 10000
+
+    DATA_MAX_POINTS = 1000
+    DATA_PAGE_SIZE = 100
+    DATA_MAX_PAGE_SIZE = 5000
+
+    LIST_PAGE_SIZE = 100
+    LIST_MAX_PAGE_SIZE = 1000
+
+    # shared by the web and ingest processes when set
+    LATEST_STORE_PATH = os.environ.get("LATEST_STORE_PATH")
+    LATEST_SEED_RANGE = "-30d"
+
+    QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    QUERY_CACHE_MAX_ENTRIES = 10000
+    QUERY_CACHE_MIN_TTL = 5
+    QUERY_CACHE_MAX_TTL = 3600
+    QUERY_CACHE_TTL_RATIO = 1 / 60
+
+    # device commands are resent until acknowledged on ack/<uid>
+    COMMAND_QOS = 1
+    # only the last setpoint sent to a device within the window is published
+    COMMAND_COALESCE_WINDOW = 0.5
+    COMMAND_RETRY_DELAY = 10
+    COMMAND_RETRY_BACKOFF = 2
+    COMMAND_RETRY_MAX_DELAY = 300
+    COMMAND_MAX_ATTEMPTS = 5
+    COMMAND_RETRY_POLL_INTERVAL = 1.0
+
+    # only one process should fire schedules, ingest.py enables the first
+    SCHEDULES_ENABLED = os.environ.get("SCHEDULES_ENABLED", "true").lower() == "true"
+    SCHEDULES_RELOAD_INTERVAL = 30
+    SCHEDULES_BATCH_SIZE = 500
 
     MIN_TEMPERATURE = 1
     MAX_TEMPERATURE = 40
@@ -39,6 +122,7 @@ class DevelopmentConfig(Config):
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
+    MQTT_ENABLED = False
 
 
 config = {
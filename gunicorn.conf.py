@@ -0,0 +1,19 @@
+import multiprocessing
+import os
+
+wsgi_app = "wsgi:app"
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+
+# threads share a worker's connection pool and caches, processes scale
+# past the GIL
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+# every worker builds its own app, so no engine, pool or thread is
+# shared across the fork
+preload_app = False
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
@@ -0,0 +1,63 @@
+import os
+import signal
+import sys
+import time
+import multiprocessing
+
+from app import create_app, point_writer, device_cache, worker_pool
+from config import config
+
+
+def stop(signum, frame):
+    sys.exit(0)
+
+
+def consume(index: int):
+    signal.signal(signal.SIGTERM, stop)
+
+    # only the first consumer fires the heat schedules
+    app = create_app(
+        os.getenv("FLASK_CONFIG", "default"),
+        ingest=True,
+        schedules=None if index == 0 else False,
+    )
+    interval = app.config["INGEST_STATS_INTERVAL"]
+
+    try:
+        while True:
+            time.sleep(interval)
+            print(
+                f"[ingest {os.getpid()}] "
+                f"workers={worker_pool.stats()} "
+                f"writer={point_writer.stats()} devices={device_cache.stats()}"
+            )
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    settings = config[os.getenv("FLASK_CONFIG", "default")]
+    count = settings.INGEST_PROCESSES
+    if count > 1 and not settings.MQTT_SHARED_GROUP:
+        sys.exit("INGEST_PROCESSES > 1 requires MQTT_SHARED_GROUP")
+
+    context = multiprocessing.get_context("spawn")
+    consumers = [
+        context.Process(target=consume, args=(i,), name=f"ingest-{i}")
+        for i in range(count)
+    ]
+    for consumer in consumers:
+        consumer.start()
+
+    def shutdown(signum, frame):
+        for consumer in consumers:
+            consumer.terminate()
+
+    signal.signal(signal.SIGTERM, shutdown)
+
+    try:
+        for consumer in consumers:
+            consumer.join()
+    except KeyboardInterrupt:
+        for consumer in consumers:
+            consumer.join()
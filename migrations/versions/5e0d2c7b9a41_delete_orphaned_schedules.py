@@ -0,0 +1,29 @@
+"""delete orphaned schedules
+
+Revision ID: 5e0d2c7b9a41
+Revises: f09eabbe2cba
+Create Date: 2026-10-18 14:02:11.518230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5e0d2c7b9a41"
+down_revision = "f09eabbe2cba"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # schedules of rooms and devices deleted before deletes cascaded to them
+    op.execute(
+        "DELETE FROM schedules "
+        "WHERE (room_id IS NOT NULL AND room_id NOT IN (SELECT id FROM rooms)) "
+        "OR (device_id IS NOT NULL AND device_id NOT IN (SELECT id FROM devices))"
+    )
+
+
+def downgrade():
+    pass
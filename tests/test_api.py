@@ -1,8 +1,70 @@
+import csv
+import json
+import os
+import tempfile
+import time
+import threading
 import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
 
-from app import create_app, db
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from flask_jwt_extended import decode_token
+from influxdb_client.client.flux_table import FluxRecord, FluxTable
+from influxdb_client.rest import ApiException
+from sqlalchemy import event
+
+from app import (
+    create_app,
+    db,
+    command_dispatcher,
+    device_cache,
+    influx_db,
+    latest_store,
+    mqtt,
+    point_writer,
+    schedule_engine,
+    token_blocklist,
+)
 from app.models.user import UserModel
 from app.models.room import RoomModel
+from app.models.device import DeviceModel
+from app.models.command import (
+    ACKNOWLEDGED,
+    FAILED,
+    SUPERSEDED,
+    CommandModel,
+    utcnow,
+)
+from app.models.uid import UidModel
+from app.models.schedule import EVERY_DAY, ScheduleModel, next_fire
+from app.influx.query import build_query, choose_window, parse_duration
+from app.influx.rollups import choose_rollup, rollup_flux
+from app.handlers.mqtt_handlers import handle_connect, process_message
+from app.ingest.codecs import decode_samples, encode_packed, encode_packed_batch
+from app.ingest.schedules import ScheduleEngine
+from app.ingest.spool import Spool
+from app.ingest.workers import WorkerPool
+from app.ingest.writer import BLOCK, DROP_OLDEST, SPILL, PointWriter
+from app.resources.data import (
+    cache_range,
+    decode_cursor,
+    encode_cursor,
+    parse_data_args,
+    stream_records,
+    within,
+)
+
+
+def flux_tables(*tables) -> list:
+    """Builds a query result with one table per list of record values."""
+    result = []
+    for index, rows in enumerate(tables):
+        table = FluxTable()
+        table.records = [FluxRecord(index, values) for values in rows]
+        result.append(table)
+    return result
 
 
 class APITestCase(unittest.TestCase):
@@ -13,6 +75,16 @@ class APITestCase(unittest.TestCase):
         db.create_all()
         self.client = self.app.test_client()
 
+    def create_device(self, uid: str = "uid") -> tuple:
+        """Returns (headers, device) for a device in a room of a new user."""
+        user = UserModel(username=f"user_{uid}", password="testpass")
+        user.save_to_db()
+        room = RoomModel(name="test_room", user_id=user.id)
+        room.save_to_db()
+        device = DeviceModel(uid=uid, name="device", room_id=room.id)
+        device.save_to_db()
+        return {"Authorization": f"Bearer {user.get_token()}"}, device
+
     def tearDown(self):
         db.session.remove()
         db.drop_all()
@@ -101,3 +173,1322 @@ class APITestCase(unittest.TestCase):
         )
         self.assertEqual(res.status_code, 200)
         self.assertEqual(res.json["name"], "renamed_room")
+
+    def test_set_room_temperature(self):
+        user = UserModel(username="testuser", password="testpass")
+        user.save_to_db()
+        token = user.get_token()
+
+        room = RoomModel(name="test_room", user_id=user.id)
+        room.save_to_db()
+        for i in range(3):
+            DeviceModel(uid=f"uid{i}", name=f"device{i}", room_id=room.id).save_to_db()
+
+        res = self.client.post(
+            f"/rooms/{room.id}/devices",
+            json={"temperature": 21},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        self.assertEqual(res.status_code, 202)
+        command_ids = res.get_json()["command_ids"]
+        self.assertEqual(len(command_ids), 3)
+
+        # setpoints are stored once the devices acknowledge the commands
+        for device in DeviceModel.find_all_by_room_id(room.id):
+            self.assertIsNone(device.temperature)
+
+        for command_id in command_ids:
+            uid = CommandModel.find_by_id(command_id).device.uid
+            command_dispatcher.acknowledge(uid, f'{{"id": {command_id}}}')
+
+        res = self.client.get(
+            f"/commands/{command_ids[0]}",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        self.assertEqual(res.get_json()["status"], "acknowledged")
+        for device in DeviceModel.find_all_by_room_id(room.id):
+            self.assertEqual(device.temperature, 21)
+
+    # the test config runs without a broker, publish to a mock instead
+    @mock.patch.object(command_dispatcher, "mqtt_enabled", True)
+    @mock.patch.object(mqtt, "publish")
+    def test_coalesce_device_temperature(self, publish):
+        user = UserModel(username="testuser", password="testpass")
+        user.save_to_db()
+        token = user.get_token()
+
+        room = RoomModel(name="test_room", user_id=user.id)
+        room.save_to_db()
+        device = DeviceModel(uid="uid", name="device", room_id=room.id)
+        device.save_to_db()
+
+        command_ids = set()
+        for temperature in (19, 20, 21):
+            res = self.client.post(
+                f"/devices/{device.id}",
+                json={"temperature": temperature},
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            self.assertEqual(res.status_code, 202)
+            command_ids.add(res.get_json()["command_id"])
+
+        self.assertEqual(len(command_ids), 1)
+
+        # the last setpoint is stored and published when the window closes
+        command = CommandModel.find_by_id(command_ids.pop())
+        for _ in range(50):
+            time.sleep(0.05)
+            db.session.refresh(command)
+            if command.attempts:
+                break
+
+        self.assertEqual(command.temperature, 21)
+        self.assertEqual(command.attempts, 1)
+        publish.assert_called_once_with(
+            "command/uid", json.dumps({"id": command.id, "set_temperature": "21"}), 1
+        )
+
+    def test_create_schedule(self):
+        user = UserModel(username="testuser", password="testpass")
+        user.save_to_db()
+        token = user.get_token()
+
+        room = RoomModel(name="test_room", user_id=user.id)
+        room.save_to_db()
+
+        res = self.client.post(
+            "/schedules",
+            json={"room_id": room.id, "temperature": 18, "time": "22:30"},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        self.assertEqual(res.status_code, 201)
+
+        res = self.client.post(
+            "/schedules",
+            json={"temperature": 18, "time": "22:30"},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        self.assertEqual(res.status_code, 400)
+
+        res = self.client.get(
+            "/schedules", headers={"Authorization": f"Bearer {token}"}
+        )
+        self.assertEqual(len(res.get_json()), 1)
+
+    def test_device_lookup_is_one_query(self):
+        user = UserModel(username="testuser", password="testpass")
+        user.save_to_db()
+        token = user.get_token()
+
+        room = RoomModel(name="test_room", user_id=user.id)
+        room.save_to_db()
+        device = DeviceModel(uid="uid", name="device", room_id=room.id)
+        device.save_to_db()
+
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", count)
+        try:
+            res = self.client.get(
+                f"/devices/{device.id}",
+                headers={"Authorization": f"Bearer {token}"},
+            )
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(statements), 1)
+
+    def test_provision_uids(self):
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        public_pem = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            key = os.path.join(directory, "key.pem")
+            with open(key, "wb") as f:
+                f.write(public_pem)
+            output = os.path.join(directory, "secrets")
+            mapping = os.path.join(directory, "mapping.csv")
+
+            res = self.app.test_cli_runner().invoke(
+                args=[
+                    "uids",
+                    "provision",
+                    "5",
+                    "--output",
+                    output,
+                    "--software-key",
+                    key,
+                    "--mapping",
+                    mapping,
+                ]
+            )
+            self.assertEqual(res.exit_code, 0, res.output)
+
+            with open(mapping, newline="") as f:
+                uids = {row["serial"]: row["uid"] for row in csv.DictReader(f)}
+            self.assertEqual(len(uids), 5)
+            self.assertEqual(
+                sorted(os.listdir(output)), sorted(f"{serial}.enc2" for serial in uids)
+            )
+            for serial, uid in uids.items():
+                self.assertNotIn(uid, serial)
+                with open(os.path.join(output, f"{serial}.enc2"), "rb") as f:
+                    secret = private_key.decrypt(f.read(), padding.PKCS1v15())
+                self.assertEqual(secret.decode(), uid)
+                self.assertIsNotNone(UidModel.find_by_uid(uid))
+
+        self.assertEqual(UidModel.query.count(), 5)
+
+    def test_list_rooms_with_devices(self):
+        user = UserModel(username="testuser", password="testpass")
+        user.save_to_db()
+        token = user.get_token()
+        headers = {"Authorization": f"Bearer {token}"}
+
+        for i in range(3):
+            room = RoomModel(name=f"room_{i}", user_id=user.id)
+            room.save_to_db()
+            for j in range(2):
+                DeviceModel(
+                    uid=f"uid_{i}_{j}", name=f"device_{j}", room_id=room.id
+                ).save_to_db()
+
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", count)
+        try:
+            res = self.client.get(
+                "/rooms?include=devices&fields=name,devices.name", headers=headers
+            )
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(statements), 2)
+        self.assertEqual(
+            res.get_json()[0],
+            {"name": "room_0", "devices": [{"name": "device_0"}, {"name": "device_1"}]},
+        )
+
+        res = self.client.get("/rooms?limit=2&fields=id", headers=headers)
+        self.assertEqual(len(res.get_json()), 2)
+        cursor = res.headers["X-Next-Cursor"]
+
+        res = self.client.get(f"/rooms?limit=2&cursor={cursor}", headers=headers)
+        self.assertEqual([room["name"] for room in res.get_json()], ["room_2"])
+        self.assertNotIn("X-Next-Cursor", res.headers)
+
+        res = self.client.get("/rooms?fields=secret", headers=headers)
+        self.assertEqual(res.status_code, 400)
+
+    def test_fast_schema_matches_marshmallow(self):
+        from app.schemas.fast import FastSchema
+        from app.schemas.room import RoomTreeSchema
+
+        room = RoomModel(name="test_room", user_id=1)
+        room.save_to_db()
+        DeviceModel(uid="uid_1", name="device_1", room_id=room.id).save_to_db()
+        DeviceModel(
+            uid="uid_2", name="device_2", temperature=21, room_id=room.id
+        ).save_to_db()
+
+        schema = RoomTreeSchema(many=True)
+        rooms = RoomModel.query.all()
+        self.assertEqual(FastSchema(schema).dump(rooms), schema.dump(rooms))
+        self.assertEqual(
+            list(FastSchema(schema).dump(rooms)[0]["devices"][0]),
+            list(schema.dump(rooms)[0]["devices"][0]),
+        )
+
+    def test_logout_revokes_token(self):
+        from app.models.revoked_token import RevokedTokenModel
+
+        user = UserModel(username="testuser", password="testpass")
+        user.save_to_db()
+        token = user.get_token()
+        other = user.get_token()
+
+        res = self.client.post(
+            "/auth/logout", headers={"Authorization": f"Bearer {token}"}
+        )
+        self.assertEqual(res.status_code, 200)
+
+        res = self.client.get("/rooms", headers={"Authorization": f"Bearer {token}"})
+        self.assertEqual(res.status_code, 401)
+        res = self.client.get("/rooms", headers={"Authorization": f"Bearer {other}"})
+        self.assertEqual(res.status_code, 200)
+
+        # a logout in another worker is picked up on the next sync
+        RevokedTokenModel(jti=decode_token(other)["jti"]).save_to_db()
+        token_blocklist.sync()
+
+        res = self.client.get("/rooms", headers={"Authorization": f"Bearer {other}"})
+        self.assertEqual(res.status_code, 401)
+
+    def test_rollup_flux_writes_floats(self):
+        flux = rollup_flux("mokki", "org", "1h", "-2h")
+
+        # one float series per aggregate, so min and max match the mean
+        self.assertLess(flux.index("toFloat()"), flux.index("aggregateWindow"))
+        for aggregate in ("mean", "min", "max"):
+            self.assertIn(f"fn: {aggregate}, createEmpty: false", flux)
+            self.assertIn(f'set(key: "agg", value: "{aggregate}")', flux)
+        self.assertEqual(flux.count('to(bucket: "mokki_1h", org: "org"'), 3)
+
+    def test_choose_rollup(self):
+        config = {
+            "INFLUXDB_ROLLUPS_ENABLED": True,
+            "INFLUXDB_BUCKET": "mokki",
+            "INFLUXDB_ROLLUPS": [
+                {"every": "1m", "retention": "30d"},
+                {"every": "1h", "retention": None},
+            ],
+        }
+        now = datetime.now(timezone.utc)
+        start, stop = now - timedelta(days=3), now - timedelta(days=2)
+
+        self.assertEqual(
+            choose_rollup(config, start, stop, timedelta(hours=2), "mean", True),
+            ("mokki_1h", timedelta(hours=2), None),
+        )
+        # the hourly rollup does not divide 90 minutes, the minute one does
+        self.assertEqual(
+            choose_rollup(config, start, stop, timedelta(minutes=90), "max", True),
+            ("mokki_1m", timedelta(minutes=90), None),
+        )
+        # a window from a point budget is rounded up to the period
+        self.assertEqual(
+            choose_rollup(config, start, stop, timedelta(minutes=90), "min", False),
+            ("mokki_1h", timedelta(hours=2), None),
+        )
+        # the minute rollup has expired for a range starting 60 days ago
+        self.assertEqual(
+            choose_rollup(
+                config,
+                now - timedelta(days=60),
+                stop,
+                timedelta(minutes=5),
+                "mean",
+                True,
+            ),
+            (None, timedelta(minutes=5), None),
+        )
+        self.assertEqual(
+            choose_rollup(config, start, stop, timedelta(hours=2), "last", True),
+            (None, timedelta(hours=2), None),
+        )
+
+        # a range ending now reads the periods the task has not completed
+        # yet from the raw bucket, from a window boundary on
+        bucket, window, rollup_stop = choose_rollup(
+            config, now - timedelta(days=1), now, timedelta(hours=2), "mean", True
+        )
+        self.assertEqual((bucket, window), ("mokki_1h", timedelta(hours=2)))
+        self.assertLessEqual(rollup_stop, now - timedelta(hours=1))
+        self.assertGreater(rollup_stop, now - timedelta(hours=4))
+        self.assertEqual(rollup_stop.timestamp() % 7200, 0)
+
+        # the hourly rollup has no completed period in the last half hour
+        bucket, window, rollup_stop = choose_rollup(
+            config, now - timedelta(minutes=30), now, timedelta(minutes=5), "mean", True
+        )
+        self.assertEqual((bucket, window), ("mokki_1m", timedelta(minutes=5)))
+        self.assertLessEqual(rollup_stop, now - timedelta(minutes=1))
+        self.assertEqual(rollup_stop.timestamp() % 300, 0)
+
+        self.assertEqual(
+            choose_rollup(
+                config,
+                now - timedelta(minutes=1),
+                now,
+                timedelta(minutes=1),
+                "mean",
+                True,
+            ),
+            (None, timedelta(minutes=1), None),
+        )
+
+        config["INFLUXDB_ROLLUPS_ENABLED"] = False
+        self.assertEqual(
+            choose_rollup(config, start, stop, timedelta(hours=2), "mean", True),
+            (None, timedelta(hours=2), None),
+        )
+
+    def test_rollup_query_reads_raw_tail(self):
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        rollup_stop = start + timedelta(hours=22)
+        stop = start + timedelta(days=1)
+        query = build_query(
+            "mokki",
+            ["uid"],
+            start,
+            stop,
+            window=timedelta(hours=2),
+            aggregate="max",
+            rollup="mokki_1h",
+            rollup_stop=rollup_stop,
+        )
+
+        self.assertTrue(query.startswith("union(tables: ["))
+        self.assertIn(
+            'from(bucket: "mokki_1h") |> range(start: 2024-01-01T00:00:00.000000Z, '
+            "stop: 2024-01-01T22:00:00.000000Z)",
+            query,
+        )
+        self.assertIn(
+            'from(bucket: "mokki") |> range(start: 2024-01-01T22:00:00.000000Z, '
+            "stop: 2024-01-02T00:00:00.000000Z)",
+            query,
+        )
+        self.assertIn('r.agg == "max"', query)
+        self.assertLess(query.index("toFloat()"), query.index("aggregateWindow"))
+        self.assertLess(query.index("aggregateWindow"), query.index("group(columns"))
+
+        query = build_query(
+            "mokki",
+            ["uid"],
+            start,
+            stop,
+            window=timedelta(hours=2),
+            rollup="mokki_1h",
+        )
+        self.assertTrue(query.startswith('from(bucket: "mokki_1h")'))
+        self.assertNotIn('from(bucket: "mokki")', query)
+        self.assertNotIn("union", query)
+
+    def test_coalesce_concurrent_device_temperature(self):
+        room = RoomModel(name="test_room", user_id=1)
+        room.save_to_db()
+        device = DeviceModel(uid="uid", name="device", room_id=room.id)
+        device.save_to_db()
+        device_id = device.id
+
+        command_ids = []
+
+        def set_temperature():
+            with self.app.app_context():
+                command_ids.append(
+                    command_dispatcher.send_coalesced(device_id, "uid", 21)
+                )
+
+        # a second request arrives while the first one is inserting
+        other = threading.Thread(target=set_temperature)
+        commit = db.session.commit
+
+        def slow_commit():
+            if not other.is_alive() and not command_ids:
+                other.start()
+                time.sleep(0.1)
+            commit()
+
+        with mock.patch.object(db.session, "commit", slow_commit):
+            command_ids.append(command_dispatcher.send_coalesced(device_id, "uid", 19))
+            other.join()
+
+        self.assertEqual(command_ids[0], command_ids[1])
+        self.assertEqual(CommandModel.query.count(), 1)
+        for _ in range(50):
+            time.sleep(0.05)
+            db.session.expire_all()
+            if CommandModel.query.one().temperature == 21:
+                break
+        self.assertEqual(CommandModel.query.one().temperature, 21)
+
+    def test_device_data_keeps_requested_range(self):
+        headers, device = self.create_device()
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        tables = flux_tables(
+            [
+                {
+                    "_time": start + timedelta(seconds=10 * i),
+                    "_value": 20.0 + i,
+                    "_field": "temperature",
+                }
+                for i in range(3)
+            ]
+        )
+
+        url = (
+            f"/devices/{device.id}/data"
+            "?start_date=2024-01-01T00:00:05Z&end_date=2024-01-01T00:00:30Z"
+        )
+        with mock.patch.object(influx_db, "query_api") as query_api:
+            query_api.return_value.query.return_value = tables
+            first = self.client.get(url, headers=headers)
+            second = self.client.get(url, headers=headers)
+
+        # absolute bounds are queried as given and the repeat is cached
+        query = query_api.return_value.query
+        self.assertEqual(query.call_count, 1)
+        self.assertIn(
+            "range(start: 2024-01-01T00:00:05.000000Z, "
+            "stop: 2024-01-01T00:00:30.000000Z)",
+            query.call_args[0][0],
+        )
+        # the point at 00:00:00 is before the range and is left out
+        self.assertEqual(first.get_json(), second.get_json())
+        self.assertEqual(
+            first.get_json()[0],
+            {
+                "timestamp": "2024-01-01T00:00:10+00:00",
+                "value": 21.0,
+                "field": "temperature",
+            },
+        )
+        self.assertEqual(len(first.get_json()), 2)
+
+    def test_cache_range_aligns_relative_ranges_only(self):
+        args = parse_data_args({"start_date": "-1h"})
+        key_start, key_stop, ttl = cache_range(args, {"start_date": "-1h"})
+        self.assertLessEqual(key_start, args["start"])
+        self.assertGreaterEqual(key_stop, args["stop"])
+        self.assertEqual(key_start.timestamp() % ttl, 0)
+
+        request_args = {
+            "start_date": "2024-01-01T00:00:05Z",
+            "end_date": "2024-01-01T01:00:00Z",
+        }
+        args = parse_data_args(request_args)
+        self.assertEqual(
+            cache_range(args, request_args)[:2], (args["start"], args["stop"])
+        )
+
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        rows = [{"_time": start + timedelta(seconds=i)} for i in range(5)]
+        self.assertEqual(
+            within(rows, start + timedelta(seconds=1), start + timedelta(seconds=3)),
+            rows[1:4],
+        )
+
+    def test_ingest_stats(self):
+        headers, device = self.create_device()
+
+        res = self.client.get("/ingest/stats", headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("query_cache", res.get_json())
+        self.assertEqual(self.client.get("/ingest/stats").status_code, 401)
+
+    @mock.patch.object(influx_db, "query_api")
+    def test_latest_store(self, query_api):
+        seeded_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        query_api.return_value.query.return_value = flux_tables(
+            [
+                {
+                    "device": "uid",
+                    "_field": "temperature",
+                    "_value": 19.5,
+                    "_time": seeded_at,
+                },
+                {
+                    "device": "uid",
+                    "_field": "humidity",
+                    "_value": 40.0,
+                    "_time": seeded_at,
+                },
+            ]
+        )
+        headers, device = self.create_device()
+        newer = int((seeded_at + timedelta(minutes=1)).timestamp() * 1e9)
+        older = int((seeded_at - timedelta(minutes=1)).timestamp() * 1e9)
+
+        with tempfile.TemporaryDirectory() as directory:
+            for path in (None, os.path.join(directory, "latest.db")):
+                self.app.config["LATEST_STORE_PATH"] = path
+                latest_store.init_app(self.app)
+                latest_store.update("uid", newer, {"temperature": 21.0})
+
+                res = self.client.get(f"/devices/{device.id}/latest", headers=headers)
+                self.assertEqual(res.status_code, 200)
+                self.assertEqual(
+                    res.get_json(),
+                    {
+                        # seeding does not replace the newer reading
+                        "temperature": {
+                            "value": 21.0,
+                            "timestamp": "2024-01-01T00:01:00+00:00",
+                        },
+                        "humidity": {
+                            "value": 40.0,
+                            "timestamp": "2024-01-01T00:00:00+00:00",
+                        },
+                    },
+                )
+
+                latest_store.update("uid", older, {"temperature": 18.0})
+                self.assertEqual(
+                    latest_store.get_many(["uid", "other"]),
+                    {"uid": res.get_json(), "other": {}},
+                )
+            latest_store._local.connection.close()
+
+        self.assertEqual(query_api.return_value.query.call_count, 2)
+
+    def test_worker_pool(self):
+        self.app.config["INGEST_WORKERS"] = 2
+        self.app.config["INGEST_WORKER_QUEUE_SIZE"] = 1
+        pool = WorkerPool(self.app)
+        release = threading.Event()
+        handled = []
+        events = {
+            value: threading.Event() for value in ("block", "queued", "fail", "last")
+        }
+
+        @pool.on_task()
+        def handle(uid, value):
+            events[value].set()
+            if value == "block":
+                release.wait(5)
+            elif value == "fail":
+                raise ValueError(value)
+            handled.append((uid, value))
+
+        pool.submit("uid", "uid", "block")
+        self.assertTrue(events["block"].wait(5))
+        pool.submit("uid", "uid", "queued")
+
+        # the queue of the busy worker is full, the task is dropped at once
+        submitted = time.monotonic()
+        pool.submit("uid", "uid", "dropped")
+        self.assertLess(time.monotonic() - submitted, 0.5)
+        self.assertEqual(pool.dropped, 1)
+
+        release.set()
+        self.assertTrue(events["queued"].wait(5))
+        pool.submit("uid", "uid", "fail")
+        self.assertTrue(events["fail"].wait(5))
+        pool.submit("uid", "uid", "last")
+        self.assertTrue(events["last"].wait(5))
+        time.sleep(0.05)
+
+        # tasks of one key are handled in order on one worker
+        self.assertEqual(
+            handled, [("uid", "block"), ("uid", "queued"), ("uid", "last")]
+        )
+        stats = pool.stats()
+        self.assertEqual(stats["processed"], 4)
+        self.assertEqual(stats["dropped"], 1)
+        self.assertEqual(stats["errors"], 1)
+
+    def test_next_fire(self):
+        # Monday 1 January 2024, 23:00 in Helsinki (UTC+2)
+        after = datetime(2024, 1, 1, 21, tzinfo=timezone.utc)
+        at = datetime.strptime("22:30", "%H:%M").time()
+
+        self.assertEqual(
+            next_fire(at, EVERY_DAY, "Europe/Helsinki", after),
+            datetime(2024, 1, 2, 20, 30, tzinfo=timezone.utc),
+        )
+        self.assertEqual(
+            next_fire(at, 0b1, "Europe/Helsinki", after),
+            datetime(2024, 1, 8, 20, 30, tzinfo=timezone.utc),
+        )
+        self.assertEqual(
+            next_fire(at, EVERY_DAY, "UTC", after),
+            datetime(2024, 1, 1, 22, 30, tzinfo=timezone.utc),
+        )
+        self.assertIsNone(next_fire(at, 0, "UTC", after))
+
+    def test_schedule_engine_fires_due_schedules(self):
+        headers, device = self.create_device()
+        DeviceModel(uid="other", name="other", room_id=device.room_id).save_to_db()
+        now = utcnow().replace(tzinfo=timezone.utc)
+        soon = (now + timedelta(hours=1)).replace(second=0, microsecond=0)
+        later = soon + timedelta(hours=1)
+        for schedule in (
+            ScheduleModel(room_id=device.room_id, temperature=18, time=soon.time()),
+            ScheduleModel(device_id=device.id, temperature=21, time=soon.time()),
+            ScheduleModel(room_id=device.room_id, temperature=16, time=later.time()),
+            ScheduleModel(
+                room_id=device.room_id, temperature=25, time=soon.time(), enabled=False
+            ),
+        ):
+            schedule.save_to_db()
+
+        scheduler = mock.Mock()
+        dispatcher = mock.Mock()
+        engine = ScheduleEngine(scheduler, dispatcher, self.app)
+        engine.reload()
+
+        # disabled schedules are left out and the earliest one is armed
+        self.assertEqual(len(engine._heap), 3)
+        self.assertEqual(engine._heap[0][0], soon.timestamp())
+        scheduler.call_at.assert_called_once_with(
+            soon.timestamp(), engine.fire, key="schedules"
+        )
+
+        with mock.patch(
+            "app.ingest.schedules.time.time", return_value=soon.timestamp()
+        ):
+            engine.fire()
+
+        # the device schedule wins over the one for its room
+        commands, uids = dispatcher.send.call_args.args
+        self.assertEqual(
+            {uid: command.temperature for command, uid in zip(commands, uids)},
+            {"uid": 21, "other": 18},
+        )
+        self.assertEqual(engine.fired, 2)
+
+        # fired schedules come back for the next day
+        tomorrow = (soon + timedelta(days=1)).timestamp()
+        self.assertEqual(
+            sorted(when for when, *_ in engine._heap),
+            [later.timestamp(), tomorrow, tomorrow],
+        )
+        scheduler.call_at.assert_called_with(
+            later.timestamp(), engine.fire, key="schedules"
+        )
+
+    def test_delete_cascades_to_schedules(self):
+        headers, device = self.create_device()
+        room_id = device.room_id
+        for json_data in (
+            {"device_id": device.id, "temperature": 21, "time": "07:00"},
+            {"room_id": room_id, "temperature": 18, "time": "22:30"},
+        ):
+            res = self.client.post("/schedules", json=json_data, headers=headers)
+            self.assertEqual(res.status_code, 201)
+
+        res = self.client.delete(f"/devices/{device.id}", headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [schedule.room_id for schedule in ScheduleModel.query.all()], [room_id]
+        )
+
+        res = self.client.delete(f"/rooms/{room_id}", headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(ScheduleModel.query.count(), 0)
+
+    def test_list_room_devices(self):
+        headers, device = self.create_device("uid_0")
+        for i in range(1, 3):
+            DeviceModel(
+                uid=f"uid_{i}", name=f"device_{i}", room_id=device.room_id
+            ).save_to_db()
+
+        res = self.client.get(
+            f"/rooms/{device.room_id}/devices?limit=2&fields=uid,name", headers=headers
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            res.get_json(),
+            [{"name": "device", "uid": "uid_0"}, {"name": "device_1", "uid": "uid_1"}],
+        )
+
+        cursor = res.headers["X-Next-Cursor"]
+        res = self.client.get(
+            f"/rooms/{device.room_id}/devices?limit=2&cursor={cursor}", headers=headers
+        )
+        self.assertEqual([item["uid"] for item in res.get_json()], ["uid_2"])
+        self.assertNotIn("X-Next-Cursor", res.headers)
+
+        for query in ("fields=secret", "cursor=!", "limit=0"):
+            res = self.client.get(
+                f"/rooms/{device.room_id}/devices?{query}", headers=headers
+            )
+            self.assertEqual(res.status_code, 400, query)
+
+    def test_point_writer_backpressure(self):
+        self.app.config.update(
+            INGEST_BATCH_SIZE=2, INGEST_BUFFER_SIZE=2, INGEST_FLUSH_INTERVAL=60
+        )
+
+        for policy, batches, dropped in (
+            (BLOCK, [["a", "b"], ["c"]], 0),
+            (DROP_OLDEST, [["b", "c"]], 1),
+        ):
+            self.app.config["INGEST_BACKPRESSURE"] = policy
+            client = mock.Mock()
+            writer = PointWriter(client, self.app)
+            if policy == DROP_OLDEST:
+                # nothing is flushed until the writer closes
+                writer.batch_size = 10
+
+            writer.write("a", "b", "c")
+            writer.close()
+
+            write = client.write_api.return_value.write
+            self.assertEqual(
+                [call.kwargs["record"] for call in write.call_args_list], batches
+            )
+            self.assertEqual(writer.points_written, 3 - dropped)
+            self.assertEqual(writer.points_dropped, dropped)
+
+        self.app.config["INGEST_BACKPRESSURE"] = "unknown"
+        self.assertRaises(ValueError, PointWriter, mock.Mock(), self.app)
+        self.app.config["INGEST_BACKPRESSURE"] = SPILL
+        self.assertRaises(ValueError, PointWriter, mock.Mock(), self.app)
+
+    def test_spool_eviction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            spool = Spool(directory, segment_bytes=8, max_bytes=16)
+            for records in (["a 1", "a 2"], ["b 1", "b 2"], ["c 1"]):
+                spool.append(records)
+
+            # a second process gets its own slot
+            other = Spool(directory)
+            self.assertNotEqual(other.directory, spool.directory)
+            other.close()
+
+            spool.evict()
+            self.assertEqual(spool.records_evicted, 2)
+            self.assertEqual(spool.oldest()[1], ["b 1", "b 2"])
+            spool.close()
+
+            # a restarted process replays what is left in its slot
+            spool = Spool(directory)
+            seq, records = spool.oldest()
+            self.assertEqual(records, ["b 1", "b 2"])
+            spool.remove(seq)
+            self.assertEqual(spool.oldest()[1], ["c 1"])
+            spool.close()
+
+    def test_point_writer_replays_spool(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.app.config.update(
+                INGEST_BATCH_SIZE=2,
+                INGEST_SPOOL_DIR=directory,
+                INGEST_SPOOL_RETRY_INTERVAL=0.01,
+            )
+            client = mock.Mock()
+            write = client.write_api.return_value.write
+            write.side_effect = [ConnectionError("InfluxDB is down"), None]
+            writer = PointWriter(client, self.app)
+
+            writer.write("a", "b")
+            deadline = time.monotonic() + 5
+            while writer.points_replayed < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            writer.close()
+
+        self.assertEqual(
+            [call.kwargs["record"] for call in write.call_args_list],
+            [["a", "b"], ["a", "b"]],
+        )
+        self.assertEqual(writer.points_spilled, 2)
+        self.assertEqual(writer.points_replayed, 2)
+        self.assertEqual(writer.flush_errors, 1)
+        self.assertFalse(writer.spool.pending())
+
+    def test_decode_packed_payload(self):
+        payload = encode_packed(21.5, 40.25, 5123)
+        self.assertEqual(len(payload), 11)
+        self.assertEqual(decode_samples(payload), [(None, 21.5, 40.25, 5123)])
+        self.assertEqual(
+            decode_samples(
+                json.dumps(
+                    {"temperature": 21.5, "humidity": 40.25, "light_level": 5123}
+                ).encode()
+            ),
+            [(None, 21.5, 40.25, 5123)],
+        )
+
+    @mock.patch.object(latest_store, "update")
+    @mock.patch.object(point_writer, "write")
+    def test_ingest_packed_reading(self, write, update):
+        self.create_device()
+        received = time.time_ns()
+
+        with mock.patch.object(mqtt, "app", self.app, create=True):
+            process_message("data/uid", encode_packed(21.5, 40.25, 5123), received)
+            process_message("data/unknown", encode_packed(21.5, 40.25, 5123), received)
+            process_message("data/uid", b"\x01\x00", received)
+
+        (point,) = write.call_args.args
+        self.assertEqual(
+            point.to_line_protocol(),
+            "sensor_data,device=uid humidity=40.25,light_level=5123i,"
+            f"temperature=21.5 {received}",
+        )
+        write.assert_called_once()
+        update.assert_called_once_with(
+            "uid",
+            received,
+            {"temperature": 21.5, "humidity": 40.25, "light_level": 5123},
+        )
+
+    def test_decode_sample_batches(self):
+        samples = [(1700000000, 21.5, 40.25, 5123), (1700000060, 22.0, 41.0, 5000)]
+        payload = encode_packed_batch(samples)
+        self.assertEqual(len(payload), 1 + 14 * 2)
+        self.assertEqual(decode_samples(payload), samples)
+        self.assertRaises(ValueError, decode_samples, payload[:-1])
+
+        payload = json.dumps(
+            [
+                {"timestamp": 1700000000, "temperature": 21.5},
+                {"humidity": 40.25, "light_level": 5123},
+            ]
+        ).encode()
+        self.assertRaises(KeyError, decode_samples, payload)
+
+    @mock.patch.object(latest_store, "update")
+    @mock.patch.object(point_writer, "write")
+    def test_ingest_sample_batch(self, write, update):
+        self.create_device()
+        received = 1700000100 * 10**9
+        samples = [
+            {"timestamp": 1700000060, "temperature": 22.0, "humidity": 41.0},
+            {"timestamp": 1700000000, "temperature": 21.5, "humidity": 40.5},
+            # ahead of the arrival time by more than INGEST_MAX_CLOCK_SKEW
+            {"timestamp": 1700001000, "temperature": 30.0, "humidity": 10.0},
+            {"temperature": 20.5, "humidity": 42.0},
+        ]
+        for sample in samples:
+            sample["light_level"] = 5000
+
+        with mock.patch.object(mqtt, "app", self.app, create=True):
+            process_message("data/uid", json.dumps(samples).encode(), received)
+
+        self.assertEqual(
+            [point.to_line_protocol().split()[-1] for point in write.call_args.args],
+            [str(1700000060 * 10**9), str(1700000000 * 10**9), str(received)],
+        )
+        # the newest sample becomes the latest reading
+        update.assert_called_once_with(
+            "uid",
+            received,
+            {"temperature": 20.5, "humidity": 42.0, "light_level": 5000},
+        )
+
+    def test_device_cache(self):
+        headers, device = self.create_device()
+        queries = device_cache.queries
+        negative_hits = device_cache.negative_hits
+
+        self.assertEqual(device_cache.get("uid"), device.id)
+        self.assertEqual(device_cache.get("uid"), device.id)
+        self.assertEqual(device_cache.queries, queries + 1)
+
+        # unknown uids cost one query per negative TTL
+        self.assertIsNone(device_cache.get("missing"))
+        self.assertIsNone(device_cache.get("missing"))
+        self.assertEqual(device_cache.queries, queries + 2)
+        self.assertEqual(device_cache.negative_hits, negative_hits + 1)
+
+        # a device added by another process is loaded on its first message
+        other = DeviceModel(uid="other", name="other", room_id=device.room_id)
+        db.session.add(other)
+        db.session.commit()
+        self.assertEqual(device_cache.get("other"), other.id)
+        self.assertEqual(device_cache.queries, queries + 3)
+
+        device.delete_from_db()
+        self.assertIsNone(device_cache.get("uid"))
+        self.assertEqual(device_cache.stats()["devices"], 1)
+
+    @mock.patch.object(schedule_engine, "start")
+    @mock.patch.object(command_dispatcher, "start")
+    @mock.patch.object(device_cache, "warm")
+    @mock.patch.object(mqtt, "subscribe")
+    def test_ingest_subscriptions(self, subscribe, warm, dispatcher, schedules):
+        for ingest, group, enabled, topics in (
+            (True, "ingest", True, ["$share/ingest/data/+", "$share/ingest/ack/+"]),
+            (True, "", False, ["data/+", "ack/+"]),
+            (False, "ingest", True, []),
+        ):
+            subscribe.reset_mock()
+            self.app.config.update(
+                MQTT_INGEST=ingest, MQTT_SHARED_GROUP=group, SCHEDULES_ENABLED=enabled
+            )
+
+            with mock.patch.object(mqtt, "app", self.app, create=True):
+                handle_connect(None, None, None, 0)
+
+            self.assertEqual(
+                [call.args[0] for call in subscribe.call_args_list], topics
+            )
+
+        # web workers neither retry commands nor fire schedules
+        self.assertEqual(dispatcher.call_count, 2)
+        schedules.assert_called_once()
+
+    def test_downsampling_window(self):
+        self.assertEqual(parse_duration("1h30m"), timedelta(minutes=90))
+        for value in ("", "5", "5x", "m5", "1h 30m"):
+            self.assertRaises(ValueError, parse_duration, value)
+
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        stop = start + timedelta(days=1)
+        self.assertIsNone(choose_window(start, stop))
+        self.assertEqual(
+            choose_window(start, stop, resolution=timedelta(minutes=5)),
+            timedelta(minutes=5),
+        )
+        # the window is widened so that a series stays within max_points
+        self.assertEqual(
+            choose_window(start, stop, timedelta(minutes=5), max_points=100),
+            timedelta(seconds=864),
+        )
+        self.assertEqual(
+            choose_window(start, start + timedelta(seconds=10), max_points=100),
+            timedelta(seconds=1),
+        )
+
+        query = build_query(
+            "mokki",
+            ["uid"],
+            start,
+            stop,
+            window=timedelta(seconds=864),
+            aggregate="max",
+        )
+        self.assertIn(
+            "|> aggregateWindow(every: 864s, fn: max, createEmpty: false)", query
+        )
+        self.assertIn('r.device == "uid"', query)
+        self.assertNotIn("aggregateWindow", build_query("mokki", ["uid"], start, stop))
+
+    def test_device_data_arguments(self):
+        headers, device = self.create_device()
+        for query in (
+            "resolution=5x",
+            "max_points=0",
+            "aggregate=median",
+            "data_type=pressure",
+            "start_date=-1h&end_date=-2h",
+        ):
+            res = self.client.get(f"/devices/{device.id}/data?{query}", headers=headers)
+            self.assertEqual(res.status_code, 400, query)
+
+    @mock.patch.object(influx_db, "query_api")
+    def test_stream_device_data(self, query_api):
+        headers, device = self.create_device()
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        (records,) = flux_tables(
+            [
+                {"_time": start, "_field": "temperature", "_value": 21.5},
+                {"_time": start, "_field": "humidity", "_value": 40.0},
+            ]
+        )
+        query_stream = query_api.return_value.query_stream
+
+        query_stream.return_value = iter(records.records)
+        res = self.client.get(
+            f"/devices/{device.id}/data?format=ndjson", headers=headers
+        )
+        self.assertEqual(res.mimetype, "application/x-ndjson")
+        self.assertEqual(
+            [json.loads(line) for line in res.get_data(as_text=True).splitlines()],
+            [
+                {
+                    "timestamp": "2024-01-01T00:00:00+00:00",
+                    "value": 21.5,
+                    "field": "temperature",
+                },
+                {
+                    "timestamp": "2024-01-01T00:00:00+00:00",
+                    "value": 40.0,
+                    "field": "humidity",
+                },
+            ],
+        )
+
+        query_stream.return_value = iter(records.records)
+        res = self.client.get(
+            f"/devices/{device.id}/data",
+            headers={**headers, "Accept": "text/csv"},
+        )
+        self.assertEqual(res.mimetype, "text/csv")
+        self.assertEqual(
+            res.get_data(as_text=True),
+            "timestamp,field,value\n"
+            "2024-01-01T00:00:00+00:00,temperature,21.5\n"
+            "2024-01-01T00:00:00+00:00,humidity,40.0\n",
+        )
+        query_api.return_value.query.assert_not_called()
+
+        with mock.patch("app.resources.data.STREAM_CHUNK_ROWS", 2):
+            chunks = list(stream_records(records.records * 2, "csv"))
+        self.assertEqual([chunk.count("\n") for chunk in chunks], [2, 2, 1])
+
+    @mock.patch.object(influx_db, "query_api")
+    def test_room_data(self, query_api):
+        headers, device = self.create_device("uid_a")
+        other = DeviceModel(uid="uid_b", name="other", room_id=device.room_id)
+        other.save_to_db()
+        empty = RoomModel(name="empty", user_id=device.room.user_id)
+        empty.save_to_db()
+        now = datetime.now(timezone.utc)
+        query = query_api.return_value.query
+        query.return_value = flux_tables(
+            [
+                {
+                    "device": "uid_a",
+                    "_time": now,
+                    "_field": "temperature",
+                    "_value": 21.0,
+                }
+            ],
+            [
+                {
+                    "device": "uid_b",
+                    "_time": now,
+                    "_field": "temperature",
+                    "_value": 19.0,
+                }
+            ],
+        )
+
+        # an absolute range is cached as given
+        url = (
+            f"/rooms/{device.room_id}/data"
+            f"?start_date={(now - timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%SZ')}"
+            f"&end_date={(now + timedelta(minutes=1)).strftime('%Y-%m-%dT%H:%M:%SZ')}"
+        )
+        for _ in range(2):
+            res = self.client.get(url, headers=headers)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(
+                [
+                    (item["device_id"], [point["value"] for point in item["data"]])
+                    for item in res.get_json()
+                ],
+                [(device.id, [21.0]), (other.id, [19.0])],
+            )
+
+        # one query for every device of the room, the second request is cached
+        query.assert_called_once()
+        self.assertIn(
+            'contains(value: r.device, set: ["uid_a", "uid_b"])',
+            query.call_args.args[0],
+        )
+
+        res = self.client.get(f"/rooms/{empty.id}/data", headers=headers)
+        self.assertEqual(res.get_json(), [])
+        other_headers, _ = self.create_device("uid_c")
+        res = self.client.get(f"/rooms/{device.room_id}/data", headers=other_headers)
+        self.assertEqual(res.status_code, 404)
+
+    @mock.patch.object(influx_db, "query_api")
+    def test_columnar_device_data(self, query_api):
+        headers, device = self.create_device()
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        query = query_api.return_value.query
+        query.return_value = flux_tables(
+            [
+                {
+                    "_time": now - timedelta(minutes=1),
+                    "temperature": 21.0,
+                    "humidity": 39.5,
+                },
+                {"_time": now, "temperature": 21.5, "humidity": 40.0},
+            ]
+        )
+
+        res = self.client.get(
+            f"/devices/{device.id}/data?format=columnar", headers=headers
+        )
+        self.assertEqual(res.status_code, 200)
+        timestamp = int(now.timestamp() * 1000)
+        self.assertEqual(
+            res.get_json(),
+            {
+                "timestamp": [timestamp - 60000, timestamp],
+                "temperature": [21.0, 21.5],
+                "humidity": [39.5, 40.0],
+            },
+        )
+        self.assertIn("|> pivot(", query.call_args.args[0])
+        self.assertEqual(
+            self.client.get(
+                f"/devices/{device.id}/data?format=xml", headers=headers
+            ).status_code,
+            400,
+        )
+
+    @mock.patch.object(influx_db, "query_api")
+    def test_device_data_pages(self, query_api):
+        headers, device = self.create_device()
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        rows = [
+            {"_time": now - timedelta(minutes=2), "_field": "humidity", "_value": 40.0},
+            {
+                "_time": now - timedelta(minutes=2),
+                "_field": "temperature",
+                "_value": 21.0,
+            },
+            {"_time": now - timedelta(minutes=1), "_field": "humidity", "_value": 41.0},
+        ]
+        query = query_api.return_value.query
+        query.return_value = flux_tables(rows)
+
+        # one point more than the page tells that there is a next page
+        res = self.client.get(f"/devices/{device.id}/data?page_size=2", headers=headers)
+        self.assertEqual([point["value"] for point in res.get_json()], [40.0, 21.0])
+        self.assertIn("|> limit(n: 3)", query.call_args.args[0])
+        cursor = res.headers["X-Next-Cursor"]
+        self.assertEqual(
+            decode_cursor(cursor), (now - timedelta(minutes=2), "temperature")
+        )
+
+        query.return_value = flux_tables(rows[2:])
+        res = self.client.get(
+            f"/devices/{device.id}/data?page_size=2&cursor={cursor}", headers=headers
+        )
+        self.assertEqual([point["value"] for point in res.get_json()], [41.0])
+        self.assertNotIn("X-Next-Cursor", res.headers)
+        self.assertIn('r._field > "temperature"', query.call_args.args[0])
+
+        for cursor in ("!", encode_cursor(now, "pressure")):
+            res = self.client.get(
+                f"/devices/{device.id}/data?cursor={cursor}", headers=headers
+            )
+            self.assertEqual(res.status_code, 400, cursor)
+
+    def test_point_writer_drops_rejected_batches(self):
+        rejected = ApiException(status=422, reason="field type conflict")
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.app.config.update(
+                INGEST_BATCH_SIZE=2,
+                INGEST_SPOOL_DIR=directory,
+                INGEST_SPOOL_RETRY_INTERVAL=0.01,
+            )
+            client = mock.Mock()
+            write = client.write_api.return_value.write
+            # a rejected batch, then a spooled one rejected when replayed
+            write.side_effect = [rejected, ConnectionError("down"), rejected, None]
+            writer = PointWriter(client, self.app)
+
+            writer.write("a", "b")
+            writer.write("c", "d")
+            deadline = time.monotonic() + 5
+            while writer.points_rejected < 4 and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+            # neither holds up the points written after them
+            self.assertFalse(writer.spool.pending())
+            writer.write("e", "f")
+            writer.close()
+
+        self.assertEqual(
+            [call.kwargs["record"] for call in write.call_args_list],
+            [["a", "b"], ["c", "d"], ["c", "d"], ["e", "f"]],
+        )
+        self.assertEqual(writer.points_rejected, 4)
+        self.assertEqual(writer.points_spilled, 2)
+        self.assertEqual(writer.points_replayed, 0)
+        self.assertEqual(writer.points_written, 2)
+
+    @mock.patch.object(command_dispatcher, "mqtt_enabled", True)
+    @mock.patch.object(mqtt, "publish")
+    def test_command_retry_and_supersession(self, publish):
+        headers, device = self.create_device()
+        old = CommandModel(device_id=device.id, temperature=20)
+        command_dispatcher.send([old], ["uid"])
+        new = CommandModel(device_id=device.id, temperature=22)
+        command_dispatcher.send([new], ["uid"])
+        self.assertEqual(CommandModel.find_by_id(old.id).status, SUPERSEDED)
+        new = CommandModel.find_by_id(new.id)
+
+        # only the newest command of the device is resent
+        CommandModel.query.update({"next_attempt_at": utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+        publish.reset_mock()
+        command_dispatcher.retry_due()
+        publish.assert_called_once_with("command/uid", json.dumps(new.payload()), 1)
+        self.assertEqual(new.attempts, 2)
+        self.assertGreater(new.next_attempt_at, utcnow())
+
+        # and given up on after COMMAND_MAX_ATTEMPTS
+        new.attempts = command_dispatcher.max_attempts
+        new.next_attempt_at = utcnow()
+        db.session.commit()
+        publish.reset_mock()
+        command_dispatcher.retry_due()
+        publish.assert_not_called()
+        self.assertEqual(new.status, FAILED)
+
+    def test_ignore_late_acknowledgements(self):
+        headers, device = self.create_device()
+        # stored by two processes at once, neither superseded the other
+        old = CommandModel(device_id=device.id, temperature=20)
+        old.save_to_db()
+        new = CommandModel(device_id=device.id, temperature=22)
+        new.save_to_db()
+
+        command_dispatcher.acknowledge("uid", json.dumps({"id": new.id}))
+        command_dispatcher.acknowledge("uid", json.dumps({"id": old.id}))
+        command_dispatcher.acknowledge("other", json.dumps({"id": new.id}))
+
+        self.assertEqual(new.status, ACKNOWLEDGED)
+        self.assertEqual(old.status, SUPERSEDED)
+        self.assertEqual(device.temperature, 22)
+
+    @mock.patch.object(command_dispatcher, "mqtt_enabled", True)
+    @mock.patch.object(mqtt, "publish")
+    def test_room_temperature_supersedes_coalesced_command(self, publish):
+        headers, device = self.create_device()
+
+        res = self.client.post(
+            f"/devices/{device.id}", json={"temperature": 25}, headers=headers
+        )
+        coalesced = CommandModel.find_by_id(res.get_json()["command_id"])
+        res = self.client.post(
+            f"/rooms/{device.room_id}/devices",
+            json={"temperature": 20},
+            headers=headers,
+        )
+        self.assertEqual(res.status_code, 202)
+
+        # the device setpoint made within the window is not published after
+        # the newer room setpoint
+        time.sleep(command_dispatcher.coalesce_window + 0.2)
+        db.session.refresh(coalesced)
+        self.assertEqual(coalesced.status, SUPERSEDED)
+        self.assertEqual(
+            [
+                json.loads(call.args[1])["set_temperature"]
+                for call in publish.call_args_list
+            ],
+            ["20"],
+        )
+
+        # and a new device setpoint starts a new command
+        res = self.client.post(
+            f"/devices/{device.id}", json={"temperature": 23}, headers=headers
+        )
+        self.assertNotEqual(res.get_json()["command_id"], coalesced.id)
+
+    def test_set_room_temperature_statements(self):
+        headers, device = self.create_device("uid_0")
+        room_id = device.room_id
+        for i in range(1, 10):
+            DeviceModel(
+                uid=f"uid_{i}", name=f"device_{i}", room_id=room_id
+            ).save_to_db()
+
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", count)
+        try:
+            res = self.client.post(
+                f"/rooms/{room_id}/devices",
+                json={"temperature": 20},
+                headers=headers,
+            )
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count)
+
+        self.assertEqual(res.status_code, 202)
+        command_ids = res.get_json()["command_ids"]
+        self.assertEqual(len(command_ids), 10)
+        self.assertEqual(
+            sorted(command_ids), [command.id for command in CommandModel.query.all()]
+        )
+        # the room, its devices, superseding pending commands and one INSERT
+        self.assertEqual(len(statements), 4, statements)
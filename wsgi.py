@@ -0,0 +1,12 @@
+import os
+
+from app import create_app
+
+# served by gunicorn (see gunicorn.conf.py), the ingest consumers in
+# ingest.py own the broker connection and publish device commands
+app = create_app(
+    os.getenv("FLASK_CONFIG", "default"),
+    ingest=False,
+    schedules=False,
+    mqtt_enabled=False,
+)